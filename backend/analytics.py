@@ -0,0 +1,211 @@
+"""Vectorized analytics over columnar conversations.
+
+These functions operate on the NumPy columns produced by columnar.py and
+return exactly what the original per-message loops in analyze_friend_data
+produced, including local-time hours/days and Counter ordering.
+
+Timing and response-time results are built from the mergeable sketches in
+sketches.py (timing_histograms, response_sketch), so an analysis can be
+extended with newly appended messages, or assembled from independently
+reduced chunks, without revisiting the messages themselves.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+from sketches import (
+    histogram_peak, log_histogram_quantile, merge_histograms, merge_log_histograms, merge_summaries,
+    new_histogram, new_log_histogram, new_summary, summary_mean, update_histogram, update_log_histogram,
+    update_summary
+)
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Response time category edges in seconds: <1 min, <5 min, <1 hour, <1 day, longer
+RESPONSE_BIN_EDGES = np.array([60, 300, 3600, 86400])
+RESPONSE_CATEGORIES = ['instant', 'quick', 'normal', 'slow', 'very_slow']
+# Response time quantiles reported alongside the mean
+RESPONSE_QUANTILES = (0.5, 0.9, 0.99)
+
+# Gaps longer than this many hours split a conversation
+GAP_THRESHOLD_HOURS = 24
+
+
+def utc_offsets(seconds):
+    """Local timezone UTC offset (in seconds) for each POSIX timestamp.
+
+    The offset is looked up once per distinct day; only days where it changes
+    (DST transitions) fall back to a per-timestamp lookup.
+    """
+    if not len(seconds):
+        return np.zeros(0, dtype=np.int64)
+    day_starts, inverse = np.unique(seconds // 86400 * 86400, return_inverse=True)
+    starts = day_starts.tolist()
+    start_offsets = np.array([time.localtime(s).tm_gmtoff for s in starts], dtype=np.int64)
+    end_offsets = np.array([time.localtime(s + 86399).tm_gmtoff for s in starts], dtype=np.int64)
+    offsets = start_offsets[inverse]
+    changed = np.flatnonzero((start_offsets != end_offsets)[inverse])
+    if changed.size:
+        offsets[changed] = [time.localtime(s).tm_gmtoff for s in seconds[changed].tolist()]
+    return offsets
+
+
+def local_hours_and_weekdays(timestamps_ms):
+    """Local hour (0-23) and weekday (0=Monday) for each millisecond timestamp."""
+    seconds = timestamps_ms // 1000
+    local_seconds = seconds + utc_offsets(seconds)
+    hours = (local_seconds // 3600) % 24
+    # 1970-01-01 was a Thursday
+    weekdays = (local_seconds // 86400 + 3) % 7
+    return hours, weekdays
+
+
+def new_timing_histograms():
+    return {'hours': new_histogram(24), 'days': new_histogram(7)}
+
+
+def timing_histograms(timestamps_ms, into=None):
+    """Local hour/weekday histograms of timestamps, added onto 'into' if given."""
+    hours, weekdays = local_hours_and_weekdays(np.asarray(timestamps_ms, dtype=np.int64))
+    return local_timing_histograms(hours, weekdays, into)
+
+
+def local_timing_histograms(hours, weekdays, into=None):
+    """Like timing_histograms(), from hours and weekdays already computed by local_hours_and_weekdays()."""
+    timing = into if into is not None else new_timing_histograms()
+    update_histogram(timing['hours'], hours)
+    update_histogram(timing['days'], weekdays)
+    return timing
+
+
+def merge_timing_histograms(earlier, later):
+    """Combine timing histograms of consecutive message ranges."""
+    return {
+        'hours': merge_histograms(earlier['hours'], later['hours']),
+        'days': merge_histograms(earlier['days'], later['days']),
+    }
+
+
+def timing_from_histograms(timing):
+    """Hourly/daily histograms and peaks from timing_histograms()."""
+    hours, days = timing['hours'], timing['days']
+    if not days['order']:
+        return {'peak_hour': 12, 'peak_day': 'Monday', 'hourly': [], 'daily': []}
+    return {
+        'peak_hour': histogram_peak(hours),
+        'peak_day': DAY_NAMES[histogram_peak(days)],
+        'hourly': [{'hour': hour, 'count': count} for hour, count in enumerate(hours['counts']) if count],
+        'daily': [{'day': DAY_NAMES[day], 'count': days['counts'][day]} for day in days['order']]
+    }
+
+
+def timing_summary(timestamps_ms):
+    """Hourly/daily histograms and peaks for a sender's message timestamps."""
+    return timing_from_histograms(timing_histograms(timestamps_ms))
+
+
+def local_isoformat(timestamps_ms):
+    """datetime.fromtimestamp(ms / 1000).isoformat() of each millisecond timestamp, as a list."""
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    local_ms = (timestamps_ms + utc_offsets(timestamps_ms // 1000) * 1000).astype('datetime64[ms]')
+    # isoformat() leaves out the fraction when it is zero, and otherwise shows microseconds
+    return np.where(
+        timestamps_ms % 1000 == 0,
+        np.datetime_as_string(local_ms, unit='s'),
+        np.datetime_as_string(local_ms, unit='us')
+    ).tolist()
+
+
+def gap_record(start_ms, end_ms, duration_hours):
+    """A conversation gap between two millisecond timestamps."""
+    return {
+        'start': datetime.fromtimestamp(start_ms / 1000).isoformat(),
+        'end': datetime.fromtimestamp(end_ms / 1000).isoformat(),
+        'duration_hours': duration_hours,
+        'duration_days': duration_hours / 24
+    }
+
+
+def response_times_and_gaps(timestamps_ms, senders, user_code, friend_code):
+    """Split consecutive-message intervals into response times and conversation gaps.
+
+    Returns (your_response_times, their_response_times, conversation_gaps), the
+    response times being float arrays of seconds in conversation order.
+    """
+    if len(timestamps_ms) < 2:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty, []
+    current_times = timestamps_ms[:-1]
+    next_times = timestamps_ms[1:]
+    next_senders = senders[1:]
+    valid = (current_times > 0) & (next_times > 0)
+    diff_seconds = np.diff(timestamps_ms) / 1000
+    diff_hours = diff_seconds / 3600
+    is_gap = valid & (diff_hours > GAP_THRESHOLD_HOURS)
+    is_response = valid & (diff_hours <= GAP_THRESHOLD_HOURS) & (senders[:-1] != next_senders)
+    your_response_times = diff_seconds[is_response & (next_senders == user_code)]
+    their_response_times = diff_seconds[is_response & (next_senders == friend_code)]
+    gap_hours = diff_hours[is_gap].tolist()
+    conversation_gaps = [
+        {'start': start, 'end': end, 'duration_hours': hours, 'duration_days': hours / 24}
+        for start, end, hours in zip(local_isoformat(current_times[is_gap]), local_isoformat(next_times[is_gap]), gap_hours)
+    ]
+    return your_response_times, their_response_times, conversation_gaps
+
+
+def new_response_sketch():
+    return {
+        'summary': new_summary(),
+        'categories': new_histogram(len(RESPONSE_CATEGORIES)),
+        'quantiles': new_log_histogram(),
+    }
+
+
+def response_sketch(response_times, into=None):
+    """Summary, speed categories and log-bucketed quantiles of response times.
+
+    Adds onto 'into' if given. The summary sum is accumulated in Python, in
+    conversation order, so the mean matches the original list-based average
+    bit for bit.
+    """
+    sketch = into if into is not None else new_response_sketch()
+    update_summary(sketch['summary'], response_times)
+    update_histogram(sketch['categories'], np.searchsorted(RESPONSE_BIN_EDGES, response_times, side='right'))
+    update_log_histogram(sketch['quantiles'], response_times)
+    return sketch
+
+
+def merge_response_sketches(earlier, later):
+    """Combine response sketches of consecutive message ranges."""
+    return {
+        'summary': merge_summaries(earlier['summary'], later['summary']),
+        'categories': merge_histograms(earlier['categories'], later['categories']),
+        'quantiles': merge_log_histograms(earlier['quantiles'], later['quantiles']),
+    }
+
+
+def mean_response_time(sketch):
+    """Average response time from response_sketch(), or None when there are none."""
+    return summary_mean(sketch['summary'])
+
+
+def categorize_response_times(sketch):
+    """Count and percentage of response times in each speed category."""
+    total = sketch['summary']['count']
+    if not total:
+        return {}
+    return {
+        name: {'count': count, 'percentage': (count / total) * 100}
+        for name, count in zip(RESPONSE_CATEGORIES, sketch['categories']['counts'])
+    }
+
+
+def response_quantiles(sketch):
+    """Approximate median, 90th and 99th percentile response times in seconds."""
+    if not sketch['summary']['count']:
+        return {}
+    return {
+        f"p{round(q * 100)}": log_histogram_quantile(sketch['quantiles'], q)
+        for q in RESPONSE_QUANTILES
+    }
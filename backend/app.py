@@ -1,43 +1,158 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
 import uuid
-import zipfile
-import json
 import shutil
 from datetime import datetime
-from collections import Counter
-import emoji
 from pathlib import Path
 import tempfile
 import gc
+import threading
 import psutil
+from binary_upload import open_upload_stream, read_columnar_upload
+from cache import process_rss
+from chunked_upload import (
+    create_upload, delete_upload, discard_upload_data, expire_uploads, finalize_upload, load_member_partial,
+    load_upload, open_local_member, record_upload_session, save_member_partial, scan_members,
+    upload_status, write_chunk
+)
+from columnar import build_conversation, message_count
+from friend_analysis import (
+    ANALYSIS_SECTIONS, aggregates_current, analysis_from_aggregates, analyze_conversation, missing_sections,
+    select_sections
+)
+from ingest import extract_friends_from_zip, infer_user_name, ingest_chat_file, ingest_chat_files, pick_friend_name
+from network import (
+    NETWORK_LEADERBOARDS, add_to_network_rankings, friendship_category, network_from_rankings, new_network_rankings
+)
+from parallel import aggregate_conversations, iter_analyses
+from session_store import make_account_store, make_analysis_store, make_session_store
+from jobs import (
+    JobCancelled, cancel_job, forget_session_jobs, get_job, get_job_result, job_status,
+    register_job_handler, resume_queued_jobs, run_in_background, submit_job, update_progress
+)
+from json_response import FastJSONProvider, compress_response, dumps_bytes
+from json_stream import iter_chat_file
+from zip_index import build_zip_index, chat_members, open_member, release_zip_handle
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
-MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # Reduced to 50MB max file size
+# ZIP and JSON uploads are parsed as streams, so this only bounds disk usage
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 4 * 1024 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 # MAX_MESSAGES_PER_FRIEND = 1000  # Limit messages per friend to prevent memory issues
 
+# Cache bounds: entry counts, idle time, and the RSS at which LRU sessions are evicted (0 disables)
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 20))
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 2000))
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 6 * 60 * 60))
+MAX_RSS_MB = int(os.environ.get('MAX_RSS_MB', 768))
+# Chats whose analysis aggregates are kept for incremental re-uploads
+ACCOUNT_CACHE_SIZE = int(os.environ.get('ACCOUNT_CACHE_SIZE', 10000))
+
+# Sections of each friend's analysis sent in streamed network results (/api/network?stream=1)
+NETWORK_STREAM_SECTIONS = ('summary', 'responses')
+
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Store session data (in production, use Redis or database)
-sessions = {}
+def evict_session(session_id, session_data):
+    """Release everything an evicted session holds: its job, uploads and cached analyses."""
+    job_id = session_data.get('job_id')
+    if job_id and not session_data.get('analysis_complete'):
+        cancel_job(job_id)
+    forget_session_jobs(session_id)
+    discard_session_zip(session_id)
+    shutil.rmtree(os.path.join(UPLOAD_FOLDER, session_id), ignore_errors=True)
+    for cache_key in friend_cache.keys():
+        if cache_key.startswith(f"{session_id}_"):
+            friend_cache.pop(cache_key)
+
+# Store session data (in memory, or on disk with SESSION_STORE=disk to share it between workers)
+sessions = make_session_store(SESSION_CACHE_SIZE, SESSION_TTL_SECONDS,
+                              max_rss_bytes=MAX_RSS_MB * 1024 * 1024, on_evict=evict_session)
 # Cache for analyzed friend data
-friend_cache = {}
+friend_cache = make_analysis_store(ANALYSIS_CACHE_SIZE, SESSION_TTL_SECONDS)
+# Analysis aggregates per (account, chat folder), extended by incremental uploads
+accounts = make_account_store(ACCOUNT_CACHE_SIZE)
 
-def get_cached_analysis(friend_id, session_id):
-    """Get cached analysis for a friend."""
+def get_cached_analysis(friend_id, session_id, sections=None):
+    """Get cached analysis for a friend, if all sections (or the given ones) have been computed."""
     cache_key = f"{session_id}_{friend_id}"
-    return friend_cache.get(cache_key)
+    analysis = friend_cache.get(cache_key)
+    if not analysis or missing_sections(analysis, sections or ANALYSIS_SECTIONS):
+        return None
+    return select_sections(analysis, sections) if sections else analysis
 
 def cache_analysis(friend_id, session_id, analysis):
-    """Cache analysis for a friend."""
+    """Cache analysis for a friend, adding its sections to those already cached."""
     cache_key = f"{session_id}_{friend_id}"
-    friend_cache[cache_key] = analysis
+    cached = friend_cache.get(cache_key)
+    friend_cache[cache_key] = {**cached, **analysis} if cached else analysis
+
+def account_chat_key(user_name, chat_folder):
+    """Key of a chat's stored aggregates; the account is recognised by the user's name."""
+    return f"{user_name.strip().lower()}/{chat_folder}"
+
+def stored_aggregates(user_name, friend, conversation):
+    """Stored aggregates for a friend if they cover exactly this conversation."""
+    if friend.get('chat_folder', 'direct_upload') == 'direct_upload':
+        return None
+    record = accounts.get(account_chat_key(user_name, friend['chat_folder']))
+    if not record or record['friend_name'] != friend['name']:
+        return None
+    aggregates = record['aggregates']
+    if not aggregates_current(aggregates):
+        return None
+    count = message_count(conversation)
+    if not count or aggregates['total_messages'] != count:
+        return None
+    if aggregates['last_timestamp'] != int(conversation['timestamps'][-1]):
+        return None
+    return aggregates
+
+def update_account_analyses(session_id, session_data, job=None):
+    """Extend each chat's stored aggregates with the messages appended since the last upload.
+
+    Chats seen for the first time are aggregated in full. The resulting analyses
+    are cached for the session, so incremental sessions start fully analyzed.
+    """
+    user_name = session_data['user_name']
+    conversations = session_data['conversations']
+    friends = []
+    tasks = []
+    for friend in session_data['friends']:
+        conversation = conversations.get(friend['id'])
+        if conversation is None or friend.get('chat_folder', 'direct_upload') == 'direct_upload':
+            continue
+        record = accounts.get(account_chat_key(user_name, friend['chat_folder']))
+        previous = record['aggregates'] if record and record['friend_name'] == friend['name'] else None
+        friends.append(friend)
+        tasks.append((conversation, friend['name'], user_name, previous))
+    
+    def report_progress(done, total):
+        update_progress(job, friends_analyzed=done)
+    
+    results = aggregate_conversations(tasks, progress=report_progress if job else None)
+    extended = 0
+    for friend, task, (aggregates, error) in zip(friends, tasks, results):
+        if error:
+            continue
+        if task[3] is not None:
+            extended += 1
+        accounts[account_chat_key(user_name, friend['chat_folder'])] = {
+            'friend_name': friend['name'],
+            'aggregates': aggregates
+        }
+        analysis, error = analysis_from_aggregates(aggregates, friend)
+        if analysis:
+            cache_analysis(friend['id'], session_id, analysis)
+    print(f"Incremental analysis for session {session_id}: {len(tasks)} chats, "
+          f"{extended} extended from a previous upload")
 
 def log_memory_usage(stage):
     """Log memory usage for debugging."""
@@ -45,94 +160,35 @@ def log_memory_usage(stage):
     memory_mb = process.memory_info().rss / 1024 / 1024
     print(f"Memory usage at {stage}: {memory_mb:.2f} MB")
 
-def extract_messages_from_zip(zip_path, session_id, user_name):
-    """Process ZIP file directly without extracting - ULTRA FAST VERSION."""
+def extract_messages_from_zip(zip_index, session_id, user_name, job=None, parsed_member=None):
+    """Stream the indexed ZIP once, building the friend list and columnar conversations.
+
+    Returns (friends, conversations, user_name, error); without a user_name, the
+    account owner is inferred from the chats (see ingest.infer_user_name). When run as a job, progress is reported per chat folder in folders and compressed bytes.
+    Message files parsed while a chunked upload arrived are taken from parsed_member.
+    """
     try:
-        log_memory_usage("start of direct ZIP processing")
+        log_memory_usage("start of streaming ZIP ingest")
         
-        # Process ZIP directly without extracting
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # Get list of all files in the ZIP
-            file_list = zip_ref.namelist()
-            
-            # Find inbox folders
-            inbox_files = [f for f in file_list if 'messages/inbox/' in f or 'inbox/' in f]
-            
-            if not inbox_files:
-                return None, "Could not find messages inbox folder. Please ensure you're uploading the messages folder from your Instagram data."
-            
-            # Extract friend list from folder structure
-            friends = []
-            added_names = set()
-            
-            # Group files by chat folder
-            chat_folders = {}
-            for file_path in inbox_files:
-                # Extract folder name from path
-                parts = file_path.split('/')
-                if len(parts) >= 3:
-                    # Find the inbox folder and the chat folder after it
-                    try:
-                        inbox_index = parts.index('inbox')
-                        if inbox_index + 1 < len(parts):
-                            chat_folder = parts[inbox_index + 1]
-                            if chat_folder not in chat_folders:
-                                chat_folders[chat_folder] = []
-                            chat_folders[chat_folder].append(file_path)
-                    except ValueError:
-                        continue
-            
-            print(f"Found {len(chat_folders)} chat folders")
-            
-            # Process each chat folder
-            for folder_name, files in chat_folders.items():
-                message_files = [f for f in files if f.endswith('message_1.json')]
-                
-                if message_files:
-                    # Try to read the first message file to get participant info
-                    try:
-                        with zip_ref.open(message_files[0]) as f:
-                            chat_data = json.load(f)
-                        
-                        # Only include one-to-one chats
-                        if 'participants' in chat_data and len(chat_data['participants']) == 2:
-                            for participant in chat_data['participants']:
-                                if 'name' in participant:
-                                    friend_name = participant['name']
-                                    if friend_name != user_name and friend_name not in added_names:
-                                        friends.append({
-                                            'id': len(friends),
-                                            'name': friend_name,
-                                            'chat_folder': folder_name,
-                                            'message_files': len([f for f in files if 'message_' in f]),
-                                            'total_messages': 'Unknown',
-                                            'analyzed': False,
-                                            'zip_path': zip_path  # Store ZIP path for later access
-                                        })
-                                        added_names.add(friend_name)
-                                        break  # Only take the first friend
-                    except Exception as e:
-                        print(f"Error reading {message_files[0]}: {e}")
-                        # Fallback: use folder name
-                        friend_name = folder_name.replace('_', ' ').title()
-                        if friend_name not in added_names:
-                            friends.append({
-                                'id': len(friends),
-                                'name': friend_name,
-                                'chat_folder': folder_name,
-                                'message_files': len([f for f in files if 'message_' in f]),
-                                'total_messages': 'Unknown',
-                                'analyzed': False,
-                                'zip_path': zip_path
-                            })
-                            added_names.add(friend_name)
-        
-        log_memory_usage("end of direct ZIP processing")
-        print(f"Extracted {len(friends)} friends from ZIP without extraction")
-        return friends, None
+        chat_folders = zip_index['chat_folders']
         
+        if not chat_folders:
+            return None, None, None, "Could not find messages inbox folder. Please ensure you're uploading the messages folder from your Instagram data."
+        
+        print(f"Found {len(chat_folders)} chat folders")
+        
+        friends, conversations, user_name = extract_friends_from_zip(
+            zip_index, user_name, lambda **progress: update_progress(job, **progress), parsed_member
+        )
+        
+        log_memory_usage("end of streaming ZIP ingest")
+        print(f"Extracted {len(friends)} friends of {user_name} from ZIP without extraction")
+        return friends, conversations, user_name, None
+        
+    except JobCancelled:
+        raise
     except Exception as e:
-        return None, str(e)
+        return None, None, None, str(e)
 
 def get_friend_details(friend_id, session_id, user_name):
     """Get real friend details on-demand."""
@@ -146,49 +202,46 @@ def get_friend_details(friend_id, session_id, user_name):
         if not friend:
             return None, "Friend not found"
         
-        # Read directly from ZIP file
-        zip_path = friend.get('zip_path')
-        if not zip_path or not os.path.exists(zip_path):
+        # Conversations ingested at upload already know everything we need
+        conversation = session_data.get('conversations', {}).get(friend['id'])
+        if conversation is not None:
+            return {
+                'real_name': friend['name'],
+                'total_messages': message_count(conversation),
+                'message_files': friend.get('message_files', 0)
+            }, None
+        
+        # Fall back to the ZIP index built at upload
+        zip_index = session_data.get('zip_index')
+        if not zip_index or not os.path.exists(zip_index['zip_path']):
             return None, "ZIP file not found"
         
+        message_files = chat_members(zip_index, friend['chat_folder'])
+        if not message_files:
+            return None, "No message files found"
+        
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Find all message files for this friend
-                chat_folder_prefix = f"messages/inbox/{friend['chat_folder']}/"
-                message_files = [f for f in zip_ref.namelist() if f.startswith(chat_folder_prefix) and 'message_' in f]
-                
-                if not message_files:
-                    return None, "No message files found"
-                
-                # Read first message file to get real participant names
-                message_files.sort()
-                first_file = message_files[0]
-                
-                with zip_ref.open(first_file) as f:
-                    chat_data = json.load(f)
-                
-                # Get real participant names
-                real_friend_name = friend['name']  # Default to folder name
-                total_messages = 0
-                
-                if 'participants' in chat_data and len(chat_data['participants']) == 2:
-                    for participant in chat_data['participants']:
-                        if 'name' in participant:
-                            participant_name = participant['name']
-                            if participant_name != user_name:
-                                real_friend_name = participant_name
-                                break
-                
-                # Count total messages across all files
-                for msg_file in message_files:
-                    try:
-                        with zip_ref.open(msg_file) as f:
-                            file_data = json.load(f)
-                        if 'messages' in file_data:
-                            total_messages += len(file_data['messages'])
-                    except Exception as e:
-                        print(f"Error reading {msg_file}: {e}")
-                        continue
+            participants = zip_index['participants'].get(friend['chat_folder'])
+            total_messages = 0
+            for msg_file in message_files:
+                try:
+                    with open_member(zip_index, msg_file) as f:
+                        for key, value in iter_chat_file(f):
+                            if key == 'message':
+                                total_messages += 1
+                            elif key == 'participants' and participants is None:
+                                participants = [p.get('name', '') for p in value]
+                except Exception as e:
+                    print(f"Error reading {msg_file['name']}: {e}")
+                    continue
+            
+            # Get real participant names
+            real_friend_name = friend['name']  # Default to folder name
+            if participants and len(participants) == 2:
+                for participant_name in participants:
+                    if participant_name != user_name:
+                        real_friend_name = participant_name
+                        break
             
             return {
                 'real_name': real_friend_name,
@@ -202,8 +255,123 @@ def get_friend_details(friend_id, session_id, user_name):
     except Exception as e:
         return None, str(e)
 
+def discard_session_zip(session_id):
+    """Close the pooled handle for a session's uploaded ZIP and delete the file."""
+    zip_path = os.path.join(UPLOAD_FOLDER, f"{session_id}.zip")
+    release_zip_handle(zip_path)
+    if os.path.exists(zip_path):
+        os.remove(zip_path)
+
+def ingest_zip_upload(session_id, zip_path, user_name, job=None, incremental=False, upload_id=None):
+    """Index and ingest an uploaded ZIP into the session; returns (friends, error).
+
+    The session keeps the account owner's name, inferred from the chats when
+    user_name is None. For a chunked upload, message files already parsed while it arrived are reused.
+    """
+    parsed_member = (lambda member: load_member_partial(upload_id, member)) if upload_id else None
+    try:
+        # Index the central directory once; the ZIP stays on disk for the session
+        print(f"Starting analysis for session {session_id}")
+        log_memory_usage("before extraction")
+        zip_index = build_zip_index(zip_path)
+        friends, conversations, user_name, error = extract_messages_from_zip(zip_index, session_id, user_name,
+                                                                             job, parsed_member)
+    except JobCancelled:
+        print(f"Upload for session {session_id} cancelled")
+        discard_session_zip(session_id)
+        raise
+    except Exception as e:
+        print(f"Error during upload/analysis: {str(e)}")
+        friends, error = None, f'Analysis failed: {str(e)}'
+    finally:
+        if upload_id:
+            discard_upload_data(upload_id)
+    
+    if error:
+        discard_session_zip(session_id)
+        return None, error
+    
+    # Force garbage collection
+    gc.collect()
+    log_memory_usage("after extraction")
+    
+    # Store session data (keeping the job id of an asynchronous upload)
+    session_data = sessions.get(session_id) or {}
+    session_data.update({
+        'user_name': user_name,
+        'friends': friends,
+        'conversations': conversations,
+        'zip_index': zip_index,
+        'created_at': datetime.now().isoformat(),
+        'analysis_complete': True,
+        'incremental': incremental
+    })
+    # Re-store so the cache re-estimates the session's size
+    sessions[session_id] = session_data
+    if incremental:
+        update_account_analyses(session_id, session_data, job)
+    
+    print(f"Analysis complete for session {session_id}. Found {len(friends)} friends.")
+    return friends, None
+
+def run_upload_job(job, session_id, zip_path, user_name, incremental=False, upload_id=None):
+    """Job handler for asynchronous ZIP uploads."""
+    friends, error = ingest_zip_upload(session_id, zip_path, user_name, job, incremental, upload_id)
+    if error:
+        raise RuntimeError(error)
+    session_data = sessions.get(session_id) or {}
+    return {'session_id': session_id, 'friends': friends, 'user_name': session_data.get('user_name')}
+
+def cancel_upload_job(session_id, zip_path, user_name, incremental=False, upload_id=None):
+    """Drop the saved ZIP of an upload job cancelled before it started."""
+    discard_session_zip(session_id)
+    if upload_id:
+        discard_upload_data(upload_id)
+
+# Chunked uploads with a pre-parse scan queued or running, and whether chunks arrived since it started
+_preparse_pending = {}
+_preparse_lock = threading.Lock()
+
+def schedule_upload_preparse(upload_id):
+    """Parse a chunked upload's newly completed message files on the job pool, one scan per upload at a time."""
+    with _preparse_lock:
+        if upload_id in _preparse_pending:
+            _preparse_pending[upload_id] = True
+            return
+        _preparse_pending[upload_id] = False
+    run_in_background(run_upload_preparse, upload_id)
+
+def run_upload_preparse(upload_id):
+    """Scan an upload for completed message files until no chunk arrived during the last scan."""
+    while True:
+        try:
+            scan_members(upload_id, preparse_upload_member)
+        except Exception as e:
+            # Finalize reads anything not parsed here through the central directory
+            print(f"Pre-parsing upload {upload_id} failed: {e}")
+        with _preparse_lock:
+            if not _preparse_pending[upload_id]:
+                del _preparse_pending[upload_id]
+                return
+            _preparse_pending[upload_id] = False
+
+def preparse_upload_member(upload_id, member):
+    """Parse an inbox message file of a chunked upload as soon as all of its bytes arrived."""
+    try:
+        participants, conversation, complete = ingest_chat_file(
+            lambda m: open_local_member(upload_id, m), member
+        )
+        save_member_partial(upload_id, member, participants, conversation, complete)
+    except Exception as e:
+        # Left for finalize, which reads the file again through the central directory
+        print(f"Could not parse {member['name']} ahead of time: {e}")
+
 def extract_from_json_files(file, session_id, user_name):
-    """Extract data from individual JSON files uploaded directly."""
+    """Extract data from individual JSON files uploaded directly.
+
+    Returns (friends, conversations, user_name, error); without a user_name, the
+    account owner is inferred from the chat's participants.
+    """
     try:
         log_memory_usage("start of JSON file processing")
         
@@ -215,39 +383,45 @@ def extract_from_json_files(file, session_id, user_name):
         file_path = os.path.join(session_path, file.filename)
         file.save(file_path)
         
-        # Try to parse the JSON file
+        # Stream the JSON file into a columnar conversation
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                chat_data = json.load(f)
+            participants, conversation = ingest_chat_files(lambda member: open(member['name'], 'rb'), [{'name': file_path}])
         except Exception as e:
-            return None, f"Invalid JSON file: {str(e)}"
+            return None, None, None, f"Invalid JSON file: {str(e)}"
         
         # Extract friend information
         friends = []
-        if 'participants' in chat_data and len(chat_data['participants']) == 2:
-            for participant in chat_data['participants']:
-                if 'name' in participant:
-                    friend_name = participant['name']
-                    if friend_name != user_name:
-                        friends.append({
-                            'id': 0,
-                            'name': friend_name,
-                            'chat_folder': 'direct_upload',
-                            'file_path': file_path
-                        })
-                        break  # Only take the first friend
+        conversations = {}
+        if conversation is not None:
+            if not user_name:
+                user_name = infer_user_name([[p.get('name', '') for p in participants]])
+            friend_name = pick_friend_name(participants, user_name, set())
+            if friend_name is not None:
+                friends.append({
+                    'id': 0,
+                    'name': friend_name,
+                    'chat_folder': 'direct_upload',
+                    'total_messages': message_count(conversation),
+                    'file_path': file_path
+                })
+                conversations[0] = conversation
         
         if not friends:
-            return None, "No valid friend found in the uploaded file"
+            return None, None, None, "No valid friend found in the uploaded file"
         
         log_memory_usage("end of JSON file processing")
-        return friends, None
+        return friends, conversations, user_name, None
         
     except Exception as e:
-        return None, str(e)
+        return None, None, None, str(e)
 
-def analyze_friend_data(friend_id, session_id, user_name):
-    """Analyze data for a specific friend with detailed insights."""
+def analyze_friend_data(friend_id, session_id, user_name, sections=None):
+    """Analyze data for a specific friend with detailed insights.
+
+    With 'sections', only those sections are returned, and only the ones not
+    cached yet are computed.
+    """
+    sections = list(sections or ANALYSIS_SECTIONS)
     try:
         session_data = sessions.get(session_id)
         if not session_data:
@@ -258,371 +432,248 @@ def analyze_friend_data(friend_id, session_id, user_name):
         if not friend:
             return None, "Friend not found"
         
-        # Check if this is client-side processed data
-        if session_data.get('client_processed'):
-            print(f"Processing client-side data for friend {friend['name']} (ID: {friend_id})")
-            messages = friend.get('messages', [])
-            print(f"Found {len(messages)} messages for {friend['name']}")
-            print(f"User name: {user_name}")
-            print(f"Friend name: {friend['name']}")
-            if not messages:
-                return None, "No messages found for this friend"
-            messages.sort(key=lambda x: x.get('timestamp_ms', 0))
-            total_messages = len(messages)
-            your_messages = sum(1 for msg in messages if msg.get('sender_name') == user_name)
-            their_messages = total_messages - your_messages
-            timestamps = [msg.get('timestamp_ms', 0) for msg in messages if msg.get('timestamp_ms', 0)]
-            first_timestamp = min(timestamps) if timestamps else None
-            last_timestamp = max(timestamps) if timestamps else None
-            friendship_duration_days = 0
-            if first_timestamp and last_timestamp and last_timestamp > first_timestamp:
-                duration_seconds = (last_timestamp - first_timestamp) / 1000
-                friendship_duration_days = duration_seconds / 86400
+        conversation = session_data.get('conversations', {}).get(friend['id'])
+        if conversation is None:
+            return None, "No messages found for this friend"
+        cached = friend_cache.get(f"{session_id}_{friend_id}") or {}
+        missing = missing_sections(cached, sections)
+        if missing:
+            aggregates = stored_aggregates(user_name, friend, conversation) if session_data.get('incremental') else None
+            if aggregates:
+                analysis, error = analysis_from_aggregates(aggregates, friend, missing)
             else:
-                friendship_duration_days = 0
-            messages_per_day = total_messages / friendship_duration_days if friendship_duration_days > 0 else 0
-            your_content = [msg.get('content', '') for msg in messages if msg.get('sender_name') == user_name and msg.get('content')]
-            their_content = [msg.get('content', '') for msg in messages if msg.get('sender_name') == friend['name'] and msg.get('content')]
-            # --- Robust stopword filtering ---
-            stopwords = set([
-                'the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'i', 'it', 'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at', 'this', 'but', 'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she', 'or', 'an', 'will', 'my', 'one', 'all', 'would', 'there', 'their', 'what', 'so', 'up', 'out', 'if', 'about', 'who', 'get', 'which', 'go', 'me', 'when', 'make', 'can', 'like', 'time', 'no', 'just', 'him', 'know', 'take', 'people', 'into', 'year', 'your', 'good', 'some', 'could', 'them', 'see', 'other', 'than', 'then', 'now', 'look', 'only', 'come', 'its', 'over', 'think', 'also', 'back', 'after', 'use', 'two', 'how', 'our', 'work', 'first', 'well', 'way', 'even', 'new', 'want', 'because', 'any', 'these', 'give', 'day', 'most', 'us',
-                'oh', 'yeah', 'yes', 'no', 'ok', 'okay', 'haha', 'lol', 'omg', 'wow', 'hey', 'hi', 'hello', 'bye', 'goodbye', 'thanks', 'thank',
-                'sent', 'used', 'am', 'as', 'were', 'was', 'is', 'are', 'did', 'had', 'has', 'u', 'im', 'dont', 'cant', 'wont', 'didnt', 'doesnt', 'should', 'shouldnt', 'couldnt', 'wouldnt', 'instagram', 'photo', 'video', 'reel', 'story', 'message', 'messages', 'chat', 'call', 'missed', 'unsent', 'attachment', 'replied', 'reply', 'link', 'shared', 'sticker', 'gif', 'voice', 'media', 'group', 'sent a photo', 'sent a video', 'sent a reel', 'sent an attachment', 'unsent a message', 'reacted to', 'video call', 'missed video call', 'you sent an attachment', 'you unsent a message', 'this message is no longer available', 'sent a voice message', 'sent a sticker', 'sent a gif', 'sent a story reply', 'replied to your story', 'replied to story', 'sent a story reply'
-            ])
-            # Add user name and variants to stopwords for your words
-            your_stopwords = set(stopwords)
-            if user_name:
-                your_stopwords.add(user_name.lower())
-                for part in user_name.lower().split():
-                    your_stopwords.add(part)
-                your_stopwords.add(user_name)
-            # Add friend's name and variants to stopwords for their words
-            their_stopwords = set(stopwords)
-            if friend['name']:
-                their_stopwords.add(friend['name'].lower())
-                for part in friend['name'].lower().split():
-                    their_stopwords.add(part)
-                their_stopwords.add(friend['name'])
-            import re
-            def analyze_words(content_list, stopwords_set):
-                words = []
-                for content in content_list:
-                    clean_words = re.findall(r'\b[a-zA-Z]+\b', content.lower())
-                    filtered_words = [word for word in clean_words if word not in stopwords_set and len(word) > 2]
-                    words.extend(filtered_words)
-                return Counter(words).most_common(15)
-            your_words = analyze_words(your_content, your_stopwords)
-            their_words = analyze_words(their_content, their_stopwords)
-            from datetime import datetime
-            your_timestamps = [msg.get('timestamp_ms', 0) for msg in messages if msg.get('sender_name') == user_name and msg.get('timestamp_ms', 0)]
-            their_timestamps = [msg.get('timestamp_ms', 0) for msg in messages if msg.get('sender_name') == friend['name'] and msg.get('timestamp_ms', 0)]
-            your_hours = [datetime.fromtimestamp(ts / 1000).hour for ts in your_timestamps]
-            your_days = [datetime.fromtimestamp(ts / 1000).strftime('%A') for ts in your_timestamps]
-            their_hours = [datetime.fromtimestamp(ts / 1000).hour for ts in their_timestamps]
-            their_days = [datetime.fromtimestamp(ts / 1000).strftime('%A') for ts in their_timestamps]
-            hour_counts = Counter(your_hours)
-            day_counts = Counter(your_days)
-            their_hour_counts = Counter(their_hours)
-            their_day_counts = Counter(their_days)
-            your_timing = {
-                'peak_hour': hour_counts.most_common(1)[0][0] if hour_counts else 12,
-                'peak_day': day_counts.most_common(1)[0][0] if day_counts else 'Monday',
-                'hourly': [{'hour': hour, 'count': count} for hour, count in sorted(hour_counts.items())],
-                'daily': [{'day': day, 'count': count} for day, count in day_counts.items()]
-            }
-            their_timing = {
-                'peak_hour': their_hour_counts.most_common(1)[0][0] if their_hour_counts else 12,
-                'peak_day': their_day_counts.most_common(1)[0][0] if their_day_counts else 'Monday',
-                'hourly': [{'hour': hour, 'count': count} for hour, count in sorted(their_hour_counts.items())],
-                'daily': [{'day': day, 'count': count} for day, count in their_day_counts.items()]
-            }
-            # --- Response time analysis ---
-            response_times = []
-            conversation_gaps = []
-            for i in range(len(messages) - 1):
-                current_msg = messages[i]
-                next_msg = messages[i + 1]
-                current_sender = current_msg.get('sender_name', '')
-                next_sender = next_msg.get('sender_name', '')
-                current_time = current_msg.get('timestamp_ms', 0)
-                next_time = next_msg.get('timestamp_ms', 0)
-                if current_time > 0 and next_time > 0:
-                    time_diff_seconds = (next_time - current_time) / 1000
-                    time_diff_hours = time_diff_seconds / 3600
-                    if time_diff_hours > 24:
-                        gap_start = datetime.fromtimestamp(current_time / 1000)
-                        gap_end = datetime.fromtimestamp(next_time / 1000)
-                        conversation_gaps.append({
-                            'start': gap_start.isoformat(),
-                            'end': gap_end.isoformat(),
-                            'duration_hours': time_diff_hours,
-                            'duration_days': time_diff_hours / 24
-                        })
-                    if time_diff_hours <= 24 and current_sender != next_sender:
-                        response_times.append({
-                            'from': current_sender,
-                            'to': next_sender,
-                            'time': time_diff_seconds
-                        })
-            your_response_times = [rt['time'] for rt in response_times if rt['to'] == user_name]
-            their_response_times = [rt['time'] for rt in response_times if rt['to'] == friend['name']]
-            def categorize_response_times(response_times):
-                if not response_times:
-                    return {}
-                instant = sum(1 for t in response_times if t < 60)
-                quick = sum(1 for t in response_times if 60 <= t < 300)
-                normal = sum(1 for t in response_times if 300 <= t < 3600)
-                slow = sum(1 for t in response_times if 3600 <= t < 86400)
-                very_slow = sum(1 for t in response_times if t >= 86400)
-                total = len(response_times)
-                return {
-                    'instant': {'count': instant, 'percentage': (instant/total)*100 if total > 0 else 0},
-                    'quick': {'count': quick, 'percentage': (quick/total)*100 if total > 0 else 0},
-                    'normal': {'count': normal, 'percentage': (normal/total)*100 if total > 0 else 0},
-                    'slow': {'count': slow, 'percentage': (slow/total)*100 if total > 0 else 0},
-                    'very_slow': {'count': very_slow, 'percentage': (very_slow/total)*100 if total > 0 else 0}
-                }
-            your_response_categories = categorize_response_times(your_response_times)
-            their_response_categories = categorize_response_times(their_response_times)
-            # --- Shared content analysis ---
-            def analyze_shared_content(message_list):
-                instagram_posts = 0
-                instagram_reels = 0
-                instagram_stories = 0
-                other_links = 0
-                story_replies = 0
-                for msg in message_list:
-                    content = msg.get('content', '') or ''
-                    content_lower = content.lower()
-                    is_story_reply = False
-                    if 'replied to your story' in content_lower or 'sent a story reply' in content_lower or 'replied to story' in content_lower:
-                        is_story_reply = True
-                    elif (('photos' in msg or 'videos' in msg) and (len(content.strip()) <= 10 or (len(content.strip()) == 1 and emoji.is_emoji(content.strip())))):
-                        is_story_reply = True
-                    if is_story_reply:
-                        story_replies += 1
-                        continue
-                    share = msg.get('share')
-                    if share and 'link' in share:
-                        link = share['link']
-                        if 'instagram.com/p/' in link or 'ig.me/p/' in link:
-                            instagram_posts += 1
-                        elif 'instagram.com/reel/' in link or 'ig.me/reel/' in link:
-                            instagram_reels += 1
-                        elif 'instagram.com/stories/' in link:
-                            instagram_stories += 1
-                        else:
-                            other_links += 1
-                    elif content.startswith('http'):
-                        other_links += 1
-                return {
-                    'instagram_posts': instagram_posts,
-                    'instagram_reels': instagram_reels,
-                    'instagram_stories': instagram_stories,
-                    'story_replies': story_replies,
-                    'other_links': other_links,
-                    'total_shared': instagram_posts + instagram_reels + instagram_stories + story_replies + other_links
-                }
-            your_shared_content = analyze_shared_content([msg for msg in messages if msg.get('sender_name') == user_name])
-            their_shared_content = analyze_shared_content([msg for msg in messages if msg.get('sender_name') != user_name])
-            your_avg_length = sum(len(content) for content in your_content) / len(your_content) if your_content else 0
-            their_avg_length = sum(len(content) for content in their_content) / len(their_content) if their_content else 0
-            # --- Friendship intensity (improved version) ---
-            score = 0
-            # Message volume (0-30 points)
-            if total_messages >= 1000:
-                score += 30
-            elif total_messages >= 500:
-                score += 20
-            elif total_messages >= 200:
-                score += 15
-            elif total_messages >= 100:
-                score += 10
-            elif total_messages >= 50:
-                score += 5
-            # Response speed (0-25 points)
-            # Use both your and their response times
-            avg_your_response = sum(your_response_times) / len(your_response_times) if your_response_times else None
-            avg_their_response = sum(their_response_times) / len(their_response_times) if their_response_times else None
-            if avg_your_response is not None and avg_their_response is not None:
-                avg_response = (avg_your_response + avg_their_response) / 2
-            elif avg_your_response is not None:
-                avg_response = avg_your_response
-            elif avg_their_response is not None:
-                avg_response = avg_their_response
-            else:
-                avg_response = None
-            if avg_response is not None:
-                if avg_response < 300:  # <5 min
-                    score += 25
-                elif avg_response < 1800:  # <30 min
-                    score += 20
-                elif avg_response < 3600:  # <1 hour
-                    score += 15
-                elif avg_response < 86400:  # <1 day
-                    score += 10
-            # Conversation gaps (0-25 points)
-            if len(conversation_gaps) == 0:
-                score += 25
-            elif len(conversation_gaps) <= 3:
-                score += 20
-            elif len(conversation_gaps) <= 10:
-                score += 15
-            elif len(conversation_gaps) <= 20:
-                score += 10
-            # Balance (0-20 points)
-            if total_messages > 0:
-                balance = abs(50 - (your_messages / total_messages * 100))
-                if balance <= 10:
-                    score += 20
-                elif balance <= 20:
-                    score += 15
-                elif balance <= 30:
-                    score += 10
-            friendship_intensity = min(score, 100)
-            friendship_rating = 'Very High' if friendship_intensity >= 80 else 'High' if friendship_intensity >= 60 else 'Moderate' if friendship_intensity >= 40 else 'Low'
-            analysis = {
-            'friend': friend,
-            'total_messages': total_messages,
-            'your_messages': your_messages,
-            'their_messages': their_messages,
-            'your_percentage': (your_messages / total_messages * 100) if total_messages > 0 else 0,
-            'their_percentage': (their_messages / total_messages * 100) if total_messages > 0 else 0,
-            'first_message': datetime.fromtimestamp(first_timestamp / 1000).isoformat() if first_timestamp else None,
-            'last_message': datetime.fromtimestamp(last_timestamp / 1000).isoformat() if last_timestamp else None,
-            'friendship_duration_days': friendship_duration_days,
-            'messages_per_day': messages_per_day,
-            'your_words': your_words,
-            'their_words': their_words,
-                'your_lengths': {'avg_length': your_avg_length, 'longest': max([len(c) for c in your_content], default=0)},
-                'their_lengths': {'avg_length': their_avg_length, 'longest': max([len(c) for c in their_content], default=0)},
-            'your_timing': your_timing,
-            'their_timing': their_timing,
-            'your_avg_response': sum(your_response_times) / len(your_response_times) if your_response_times else 0,
-            'their_avg_response': sum(their_response_times) / len(their_response_times) if their_response_times else 0,
-            'your_response_categories': your_response_categories,
-            'their_response_categories': their_response_categories,
-            'your_response_count': len(your_response_times),
-            'their_response_count': len(their_response_times),
-            'your_shared_content': your_shared_content,
-            'their_shared_content': their_shared_content,
-            'conversation_gaps': conversation_gaps,
-            'gap_count': len(conversation_gaps),
-            'friendship_intensity': friendship_intensity,
-                'friendship_rating': friendship_rating
-        }
+                analysis, error = analyze_conversation(conversation, friend, user_name, missing)
+            if error:
+                return None, error
             cache_analysis(friend_id, session_id, analysis)
-            return analysis, None
+            cached = {**cached, **analysis}
+        return select_sections(cached, sections), None
     except Exception as e:
         print(f"Error in analyze_friend_data for friend_id {friend_id}: {e}")
         return None, f"Error analyzing friend: {e}"
 
-def analyze_network_data(session_id, user_name):
-    """Analyze social network data."""
+def iter_network_analysis(session_id, user_name, rankings, job=None):
+    """Analyze the social network, adding each friend's analysis to rankings as it completes.
+
+    Yields ('friend', friend, analysis) after each analysis is added (see
+    new_network_rankings), in completion order, or ('error', message) if
+    there's no network.
+    """
     session_data = sessions.get(session_id)
     if not session_data:
-        return None, "Session not found"
+        yield 'error', "Session not found"
+        return
     friends = session_data['friends']
-    # Check if this is client-side processed data
-    if session_data.get('client_processed'):
-        network_data = []
-        for friend in friends:
-            analysis, error = analyze_friend_data(friend['id'], session_id, user_name)
+    conversations = session_data.get('conversations', {})
+    errors = []
+    done = 0
+    
+    def finish(position, analysis, error):
+        nonlocal done
+        done += 1
+        update_progress(job, friends_done=done, friends_total=len(friends))
+        if analysis:
+            # Positions order ties, so rankings don't depend on completion order
+            add_to_network_rankings(rankings, analysis, position)
+        elif error:
+            errors.append((position, f"{friends[position]['name']}: {error}"))
+    
+    # Reuse cached analyses and fan the rest out to the analysis pool
+    pending = []
+    tasks = []
+    for position, friend in enumerate(friends):
+        cached_analysis = get_cached_analysis(friend['id'], session_id)
+        aggregates = None
+        if not cached_analysis and session_data.get('incremental') and friend['id'] in conversations:
+            aggregates = stored_aggregates(user_name, friend, conversations[friend['id']])
+        if cached_analysis:
+            analysis, error = cached_analysis, None
+        elif aggregates:
+            analysis, error = analysis_from_aggregates(aggregates, friend)
+        elif friend['id'] in conversations:
+            pending.append(position)
+            tasks.append((conversations[friend['id']], friend, user_name))
+            continue
+        else:
+            analysis, error = None, "No messages found for this friend"
+        finish(position, analysis, error)
+        if analysis:
+            yield 'friend', friend, analysis
+    
+    analyses = iter_analyses(tasks)
+    try:
+        for index, (analysis, error) in analyses:
+            friend = friends[pending[index]]
             if analysis:
-                network_data.append(analysis)
-        if not network_data:
-            return None, "No network data available from client-side processing"
-        most_messages = sorted(network_data, key=lambda x: x['total_messages'], reverse=True)[:10]
-        most_balanced = sorted(network_data, key=lambda x: abs(50 - x['your_percentage']))[:10]
-        longest_friendships = sorted(network_data, key=lambda x: x['friendship_duration_days'], reverse=True)[:10]
-        fastest_responses = sorted(network_data, key=lambda x: x['their_avg_response'])[:10]
-        categories = {
-            'best_friends': [],
-            'close_friends': [],
-            'regular_friends': [],
-            'occasional_friends': [],
-            'distant_friends': []
-        }
-        for friend_data in network_data:
-            total_messages = friend_data['total_messages']
-            messages_per_day = total_messages / friend_data['friendship_duration_days'] if friend_data['friendship_duration_days'] > 0 else 0
-            if total_messages >= 1000 and messages_per_day >= 2:
-                categories['best_friends'].append(friend_data)
-            elif total_messages >= 500 and messages_per_day >= 1:
-                categories['close_friends'].append(friend_data)
-            elif total_messages >= 200 and messages_per_day >= 0.5:
-                categories['regular_friends'].append(friend_data)
-            elif total_messages >= 50:
-                categories['occasional_friends'].append(friend_data)
-            else:
-                categories['distant_friends'].append(friend_data)
-        return {
-            'total_friends': len(network_data),
-            'total_messages': sum(f['total_messages'] for f in network_data),
-            'most_messages': most_messages,
-            'most_balanced': most_balanced,
-            'longest_friendships': longest_friendships,
-            'fastest_responses': fastest_responses,
-            'categories': categories
-        }, None
-    else:
-        # Original server-side processing logic
-        network_data = []
-        errors = []
-        
-        for friend in friends:
-            try:
-                analysis, error = analyze_friend_data(friend['id'], session_id, user_name)
-                if analysis:
-                    network_data.append(analysis)
-                elif error:
-                    errors.append(f"{friend['name']}: {error}")
-            except Exception as e:
-                errors.append(f"{friend['name']}: {e}")
-                print(f"Error analyzing friend {friend['name']}: {e}")
-        
-        if not network_data:
-            return None, f"No network data available. Errors: {'; '.join(errors)}"
-        
-        # Sort by different metrics
-        most_messages = sorted(network_data, key=lambda x: x['total_messages'], reverse=True)[:10]
-        most_balanced = sorted(network_data, key=lambda x: abs(50 - x['your_percentage']))[:10]
-        longest_friendships = sorted(network_data, key=lambda x: x['friendship_duration_days'], reverse=True)[:10]
-        fastest_responses = sorted(network_data, key=lambda x: x['their_avg_response'])[:10]
-        
-        # Categorize friendships
-        categories = {
-            'best_friends': [],
-            'close_friends': [],
-            'regular_friends': [],
-            'occasional_friends': [],
-            'distant_friends': []
-        }
-        
-        for friend_data in network_data:
-            total_messages = friend_data['total_messages']
-            messages_per_day = total_messages / friend_data['friendship_duration_days'] if friend_data['friendship_duration_days'] > 0 else 0
-            
-            if total_messages >= 1000 and messages_per_day >= 2:
-                categories['best_friends'].append(friend_data)
-            elif total_messages >= 500 and messages_per_day >= 1:
-                categories['close_friends'].append(friend_data)
-            elif total_messages >= 200 and messages_per_day >= 0.5:
-                categories['regular_friends'].append(friend_data)
-            elif total_messages >= 50:
-                categories['occasional_friends'].append(friend_data)
-            else:
-                categories['distant_friends'].append(friend_data)
-        
-        return {
-            'total_friends': len(network_data),
-            'total_messages': sum(f['total_messages'] for f in network_data),
-            'most_messages': most_messages,
-            'most_balanced': most_balanced,
-            'longest_friendships': longest_friendships,
-            'fastest_responses': fastest_responses,
-            'categories': categories
-        }, None
+                cache_analysis(friend['id'], session_id, analysis)
+            finish(pending[index], analysis, error)
+            if analysis:
+                yield 'friend', friend, analysis
+    finally:
+        analyses.close()
+    
+    if not rankings['total_friends']:
+        if session_data.get('client_processed'):
+            yield 'error', "No network data available from client-side processing"
+        else:
+            yield 'error', f"No network data available. Errors: {'; '.join(message for _, message in sorted(errors))}"
+
+def analyze_network_data(session_id, user_name, job=None):
+    """Analyze social network data."""
+    rankings = new_network_rankings()
+    for event in iter_network_analysis(session_id, user_name, rankings, job):
+        if event[0] == 'error':
+            return None, event[1]
+    return network_from_rankings(rankings), None
+
+def network_stream_records(session_id, user_name):
+    """Records of a streamed network analysis.
+
+    'start' gives the number of friends; each analyzed friend then gets a
+    'friend' record (its summary and category) followed by a 'rankings' record
+    (running totals, leaderboards as friend ids and category counts); a final
+    'summary' record has the network in the refs=1 form, without 'analyses'.
+    Failures end the stream with an 'error' record.
+    """
+    session_data = sessions.get(session_id)
+    yield {'type': 'start', 'friends_total': len(session_data['friends']) if session_data else 0}
+    rankings = new_network_rankings()
+    try:
+        for event in iter_network_analysis(session_id, user_name, rankings):
+            if event[0] == 'error':
+                yield {'type': 'error', 'error': event[1]}
+                return
+            _, friend, analysis = event
+            yield {
+                'type': 'friend',
+                'friend': select_sections(analysis, NETWORK_STREAM_SECTIONS),
+                'category': friendship_category(analysis)
+            }
+            yield {
+                'type': 'rankings',
+                'total_friends': rankings['total_friends'],
+                'total_messages': rankings['total_messages'],
+                'leaderboards': {
+                    name: [analysis['friend']['id'] for analysis in leaderboard.top()]
+                    for name, leaderboard in rankings['leaderboards'].items()
+                },
+                'category_counts': {name: len(entries) for name, entries in rankings['categories'].items()}
+            }
+    except Exception as e:
+        print(f"Error streaming network analysis: {e}")
+        yield {'type': 'error', 'error': str(e)}
+        return
+    summary = network_by_reference(network_from_rankings(rankings))
+    del summary['analyses']
+    yield {'type': 'summary', **summary}
+
+def encode_stream_record(record, event_stream):
+    """One streamed record as an NDJSON line or a Server-Sent Event."""
+    data = dumps_bytes(record)
+    if event_stream:
+        return b'event: ' + record['type'].encode() + b'\ndata: ' + data + b'\n\n'
+    return data + b'\n'
+
+def network_by_reference(network):
+    """Network analysis with each friend's analysis sent once.
+
+    Analyses go in 'analyses' keyed by friend id; rankings and categories list
+    friend ids, where they would otherwise repeat an analysis up to five times.
+    """
+    analyses = {}
+    def friend_ids(entries):
+        for analysis in entries:
+            analyses[str(analysis['friend']['id'])] = analysis
+        return [analysis['friend']['id'] for analysis in entries]
+    by_reference = dict(network)
+    for key in NETWORK_LEADERBOARDS:
+        by_reference[key] = friend_ids(network[key])
+    by_reference['categories'] = {name: friend_ids(entries) for name, entries in network['categories'].items()}
+    by_reference['analyses'] = analyses
+    return by_reference
+
+def run_network_job(job, session_id):
+    """Job handler for asynchronous network analysis."""
+    session_data = sessions.get(session_id)
+    if not session_data:
+        raise RuntimeError("Session not found")
+    network, error = analyze_network_data(session_id, session_data['user_name'], job)
+    if error:
+        raise RuntimeError(error)
+    return network
+
+register_job_handler('upload_zip', run_upload_job, on_cancel=cancel_upload_job)
+register_job_handler('network', run_network_job)
+
+def requested_sections():
+    """Analysis sections named in the 'fields' query parameter (None for all), and an error."""
+    fields = request.args.get('fields')
+    if not fields:
+        return None, None
+    sections = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [section for section in sections if section not in ANALYSIS_SECTIONS]
+    if unknown:
+        return None, f"Unknown analysis fields: {', '.join(unknown)} (expected {', '.join(ANALYSIS_SECTIONS)})"
+    return sections, None
+
+def request_flag(name):
+    """True when a boolean query/form flag (e.g. async=1) is set on the request."""
+    value = request.values.get(name, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.before_request
+def resume_jobs():
+    # Pick up jobs a previous worker left unfinished in JOB_QUEUE_DIR
+    resume_queued_jobs()
+
+@app.before_request
+def trim_caches():
+    # Expire idle entries and relieve memory pressure even when nothing new is cached
+    sessions.trim()
+    friend_cache.trim()
+    expire_uploads()
+
+def store_processed_session(user_name, friends, conversations, incremental=False):
+    """Store a session for chats processed client-side and return its id."""
+    session_id = str(uuid.uuid4())
+    session_data = {
+        'user_name': user_name,
+        'friends': friends,
+        'conversations': conversations,
+        'created_at': datetime.now().isoformat(),
+        'analysis_complete': True,
+        'client_processed': True,  # Mark as client-processed
+        'incremental': incremental
+    }
+    sessions[session_id] = session_data
+    
+    print(f"Received {len(friends)} friends from client-side processing")
+    if incremental:
+        update_account_analyses(session_id, session_data)
+    return session_id
+
+def start_upload_job(session_id, zip_path, user_name, incremental=False, upload_id=None):
+    """Create the session of an asynchronous ZIP upload and queue its ingest job."""
+    # The session exists before the job is queued so the job can't race its creation
+    job_id = str(uuid.uuid4())
+    sessions[session_id] = {
+        'user_name': user_name,
+        'friends': [],
+        'conversations': {},
+        'zip_index': None,
+        'created_at': datetime.now().isoformat(),
+        'analysis_complete': False,
+        'job_id': job_id
+    }
+    return submit_job('upload_zip', {
+        'session_id': session_id, 'zip_path': zip_path, 'user_name': user_name,
+        'incremental': incremental, 'upload_id': upload_id
+    }, session_id=session_id, job_id=job_id)
+
+@app.after_request
+def compress_json_response(response):
+    """Compress JSON responses for clients that accept gzip (or brotli)."""
+    return compress_response(response, request.headers.get('Accept-Encoding'))
 
 @app.route('/api/upload-processed', methods=['POST'])
 def upload_processed_data():
@@ -633,19 +684,14 @@ def upload_processed_data():
         if not data or 'friends' not in data:
             return jsonify({'success': False, 'error': 'Invalid data format'})
         
-        # Generate session ID
-        session_id = str(uuid.uuid4())
+        # Convert each conversation to columnar form once and drop the raw message dicts
+        conversations = {}
+        for friend in data['friends']:
+            conversations[friend['id']] = build_conversation(friend.pop('messages', None) or [])
+        log_memory_usage("after columnar ingest")
         
-        # Store session data
-        sessions[session_id] = {
-            'user_name': data.get('user_name', 'User'),
-            'friends': data['friends'],
-            'created_at': datetime.now().isoformat(),
-            'analysis_complete': True,
-            'client_processed': True  # Mark as client-processed
-        }
-        
-        print(f"Received {len(data['friends'])} friends from client-side processing")
+        session_id = store_processed_session(data.get('user_name', 'User'), data['friends'], conversations,
+                                             bool(data.get('incremental')))
         
         return jsonify({
             'success': True,
@@ -658,6 +704,34 @@ def upload_processed_data():
         print(f"Error processing uploaded data: {str(e)}")
         return jsonify({'success': False, 'error': f'Processing failed: {str(e)}'})
 
+@app.route('/api/upload-columnar', methods=['POST'])
+def upload_columnar_data():
+    """Receive client-processed chats in the compact columnar encoding (see binary_upload.py)."""
+    try:
+        stream, error = open_upload_stream(request.stream, request.headers.get('Content-Encoding'))
+        if error:
+            return jsonify({'success': False, 'error': error})
+        
+        upload, error = read_columnar_upload(stream)
+        if error:
+            return jsonify({'success': False, 'error': error})
+        log_memory_usage("after columnar upload")
+        
+        friends = upload['friends']
+        session_id = store_processed_session(upload['user_name'], friends, upload['conversations'],
+                                             upload['incremental'])
+        
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'friends': friends,
+            'message': f'Successfully processed {len(friends)} friends!'
+        })
+        
+    except Exception as e:
+        print(f"Error processing columnar upload: {str(e)}")
+        return jsonify({'success': False, 'error': f'Processing failed: {str(e)}'})
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and data extraction."""
@@ -665,7 +739,10 @@ def upload_file():
         return jsonify({'success': False, 'error': 'No file provided'})
     
     file = request.files['file']
-    user_name = request.form.get('user_name', 'Rayaan Raza')
+    # Inferred from the chats when not given
+    user_name = request.form.get('user_name', '').strip() or None
+    # Reuse stored aggregates of this account's chats and only analyze newly appended messages
+    incremental = request_flag('incremental')
     
     if file.filename == '':
         return jsonify({'success': False, 'error': 'No file selected'})
@@ -685,37 +762,35 @@ def upload_file():
             zip_path = os.path.join(UPLOAD_FOLDER, f"{session_id}.zip")
             file.save(zip_path)
             
-            # Extract and analyze data with progress tracking
-            print(f"Starting analysis for session {session_id}")
-            log_memory_usage("before extraction")
-            
-            friends, error = extract_messages_from_zip(zip_path, session_id, user_name)
+            if request_flag('async'):
+                # Ingest in the background; poll /api/progress or /api/jobs for the result
+                job = start_upload_job(session_id, zip_path, user_name, incremental)
+                return jsonify({
+                    'success': True,
+                    'session_id': session_id,
+                    'job_id': job['id'],
+                    'message': 'Upload received, analysis started.'
+                })
             
-            # Clean up ZIP file
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
+            friends, error = ingest_zip_upload(session_id, zip_path, user_name, incremental=incremental)
                 
         else:
             # Handle individual JSON files (direct upload)
-            friends, error = extract_from_json_files(file, session_id, user_name)
+            friends, conversations, user_name, error = extract_from_json_files(file, session_id, user_name)
+            if not error:
+                sessions[session_id] = {
+                    'user_name': user_name,
+                    'friends': friends,
+                    'conversations': conversations,
+                    'zip_index': None,
+                    'created_at': datetime.now().isoformat(),
+                    'analysis_complete': True
+                }
+                print(f"Analysis complete for session {session_id}. Found {len(friends)} friends.")
         
         if error:
             return jsonify({'success': False, 'error': error})
         
-        # Force garbage collection
-        gc.collect()
-        log_memory_usage("after extraction")
-        
-        # Store session data
-        sessions[session_id] = {
-            'user_name': user_name,
-            'friends': friends,
-            'created_at': datetime.now().isoformat(),
-            'analysis_complete': True
-        }
-        
-        print(f"Analysis complete for session {session_id}. Found {len(friends)} friends.")
-        
         # Final cleanup
         gc.collect()
         log_memory_usage("end of upload")
@@ -730,11 +805,102 @@ def upload_file():
     except Exception as e:
         print(f"Error during upload/analysis: {str(e)}")
         # Cleanup on error
-        zip_path = os.path.join(UPLOAD_FOLDER, f"{session_id}.zip")
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        discard_session_zip(session_id)
         return jsonify({'success': False, 'error': f'Analysis failed: {str(e)}'})
 
+@app.route('/api/uploads', methods=['POST'])
+def initiate_chunked_upload():
+    """Start a chunked, resumable ZIP upload from {filename, size, user_name, incremental}."""
+    data = request.get_json(silent=True) or {}
+    if not str(data.get('filename', '')).endswith('.zip'):
+        return jsonify({'success': False, 'error': 'Chunked uploads take a ZIP file containing the messages folder'})
+    state, error = create_upload(data['filename'], data.get('size'), {
+        # Inferred from the chats when not given
+        'user_name': (data.get('user_name') or '').strip() or None,
+        'incremental': bool(data.get('incremental'))
+    })
+    if error:
+        return jsonify({'success': False, 'error': error})
+    return jsonify({'success': True, **upload_status(state)})
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Progress of a chunked upload, including the byte ranges still missing."""
+    state = load_upload(upload_id)
+    if state is None:
+        return jsonify({'success': False, 'error': 'Upload not found'})
+    return jsonify({'success': True, **upload_status(state)})
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Abort a chunked upload and delete what it received."""
+    if not delete_upload(upload_id):
+        return jsonify({'success': False, 'error': 'Upload not found'})
+    return jsonify({'success': True})
+
+@app.route('/api/uploads/<upload_id>/chunks', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Store the request body at ?offset=N, checked against its X-Chunk-SHA256 header."""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': 'Missing chunk offset'})
+    state, error = write_chunk(upload_id, offset, request.get_data(cache=False),
+                               request.headers.get('X-Chunk-SHA256'))
+    if error:
+        return jsonify({'success': False, 'error': error})
+    # Parse message files whose bytes have all arrived while the rest is still uploading,
+    # off the request so the chunk is acknowledged at once
+    schedule_upload_preparse(upload_id)
+    return jsonify({'success': True, **upload_status(load_upload(upload_id) or state)})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Finalize a chunked upload (optionally checking {sha256}) and ingest it like /api/upload."""
+    data = request.get_json(silent=True) or {}
+    session_id = str(uuid.uuid4())
+    zip_path = os.path.join(UPLOAD_FOLDER, f"{session_id}.zip")
+    state, error = finalize_upload(upload_id, zip_path, data.get('sha256'))
+    if error:
+        if state and state['session_id']:
+            # A retried finalize; the upload already became a session
+            session_data = sessions.get(state['session_id'])
+            return jsonify({
+                'success': True,
+                'session_id': state['session_id'],
+                'job_id': state['job_id'],
+                'friends': session_data['friends'] if session_data else None,
+                'message': 'Upload already finalized.'
+            })
+        return jsonify({'success': False, 'error': error})
+    
+    user_name = state['params']['user_name']
+    incremental = state['params']['incremental']
+    
+    if request_flag('async') or data.get('async'):
+        job = start_upload_job(session_id, zip_path, user_name, incremental, upload_id)
+        record_upload_session(upload_id, session_id, job['id'])
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'job_id': job['id'],
+            'message': 'Upload received, analysis started.'
+        })
+    
+    friends, error = ingest_zip_upload(session_id, zip_path, user_name, incremental=incremental,
+                                       upload_id=upload_id)
+    if error:
+        return jsonify({'success': False, 'error': error})
+    record_upload_session(upload_id, session_id)
+    gc.collect()
+    log_memory_usage("end of chunked upload")
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'friends': friends,
+        'message': f'Analysis complete! Found {len(friends)} friends to analyze.'
+    })
+
 @app.route('/api/friend-details/<friend_id>', methods=['GET'])
 def get_friend_details_endpoint(friend_id):
     """Get detailed friend information on-demand."""
@@ -790,16 +956,30 @@ def get_progress(session_id):
     if not session_data:
         return jsonify({'success': False, 'error': 'Session not found'})
     
-    return jsonify({
+    progress = {
         'success': True,
         'status': 'complete' if session_data.get('analysis_complete') else 'processing',
         'friends_count': len(session_data.get('friends', [])),
         'created_at': session_data.get('created_at')
-    })
+    }
+    job = get_job(session_data['job_id']) if session_data.get('job_id') else None
+    if job:
+        status = job_status(job)
+        if status['status'] in ('failed', 'cancelled'):
+            progress['status'] = status['status']
+            progress['error'] = status['error']
+        progress['job_id'] = status['job_id']
+        progress['progress'] = status['progress']
+        progress['eta_seconds'] = status['eta_seconds']
+    return jsonify(progress)
 
 @app.route('/api/analysis/<friend_id>', methods=['GET'])
 def get_friend_analysis(friend_id):
-    """Get detailed analysis for a specific friend."""
+    """Get detailed analysis for a specific friend.
+
+    'fields' selects sections (e.g. fields=summary,words); each is computed on
+    first request and cached on its own.
+    """
     session_id = request.args.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'error': 'Session ID required'})
@@ -808,14 +988,18 @@ def get_friend_analysis(friend_id):
     if not session_data:
         return jsonify({'success': False, 'error': 'Session not found'})
     
-    cached_analysis = get_cached_analysis(friend_id, session_id)
+    sections, error = requested_sections()
+    if error:
+        return jsonify({'success': False, 'error': error})
+    
+    cached_analysis = get_cached_analysis(friend_id, session_id, sections)
     if cached_analysis:
         return jsonify({
             'success': True,
             'analysis': cached_analysis
         })
 
-    analysis, error = analyze_friend_data(friend_id, session_id, session_data['user_name'])
+    analysis, error = analyze_friend_data(friend_id, session_id, session_data['user_name'], sections)
     
     if error:
         return jsonify({'success': False, 'error': error})
@@ -827,7 +1011,12 @@ def get_friend_analysis(friend_id):
 
 @app.route('/api/network', methods=['GET'])
 def get_network_analysis():
-    """Get social network analysis."""
+    """Get social network analysis.
+
+    With stream=1 (or Accept: text/event-stream), results are streamed as
+    friends are analyzed (see network_stream_records): NDJSON, or Server-Sent
+    Events when the client accepts them.
+    """
     session_id = request.args.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'error': 'Session ID required'})
@@ -836,6 +1025,23 @@ def get_network_analysis():
     if not session_data:
         return jsonify({'success': False, 'error': 'Session not found'})
     
+    event_stream = request.accept_mimetypes.best == 'text/event-stream'
+    if request_flag('stream') or event_stream:
+        records = network_stream_records(session_id, session_data['user_name'])
+        return Response(
+            stream_with_context(encode_stream_record(record, event_stream) for record in records),
+            mimetype='text/event-stream' if event_stream else 'application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    if request_flag('async'):
+        job = submit_job('network', {'session_id': session_id}, session_id=session_id)
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'job_id': job['id']
+        })
+    
     network, error = analyze_network_data(session_id, session_data['user_name'])
     
     if error:
@@ -843,9 +1049,50 @@ def get_network_analysis():
     
     return jsonify({
         'success': True,
-        'network': network
+        'network': network_by_reference(network) if request_flag('refs') else network
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get status, progress and ETA of a background job."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'})
+    
+    return jsonify({
+        'success': True,
+        'job': job_status(job)
+    })
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result_endpoint(job_id):
+    """Get the result of a completed background job."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'})
+    if job['status'] != 'complete':
+        return jsonify({
+            'success': False,
+            'error': job.get('error') or f"Job is {job['status']}",
+            'status': job['status']
+        })
+    
+    result = get_job_result(job_id)
+    if job['kind'] == 'network' and result and request_flag('refs'):
+        result = network_by_reference(result)
+    return jsonify({
+        'success': True,
+        'result': result
     })
 
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_endpoint(job_id):
+    """Cancel a queued or running background job."""
+    if not cancel_job(job_id):
+        return jsonify({'success': False, 'error': 'Job not found or already finished'})
+    
+    return jsonify({'success': True, 'job_id': job_id})
+
 @app.route('/api/friends', methods=['GET'])
 def get_friends():
     """Get list of friends."""
@@ -898,6 +1145,19 @@ def health_check():
     """Health check endpoint."""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Cache hit/miss/eviction counters and process memory."""
+    return jsonify({
+        'success': True,
+        'memory_mb': round(process_rss() / 1024 / 1024, 2),
+        'max_rss_mb': MAX_RSS_MB,
+        'caches': {
+            'sessions': sessions.stats(),
+            'analyses': friend_cache.stats()
+        }
+    })
+
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint - redirect to frontend or show API info."""
@@ -909,7 +1169,9 @@ def root():
             'upload': '/api/upload',
             'friends': '/api/friends',
             'analysis': '/api/analysis/<friend_id>',
-            'network': '/api/network'
+            'network': '/api/network',
+            'jobs': '/api/jobs/<job_id>',
+            'stats': '/api/stats'
         },
         'instructions': 'This is the backend API. Use the frontend at http://localhost:5173 to interact with the application.'
     })
@@ -0,0 +1,203 @@
+"""Compact columnar encoding for client-processed uploads.
+
+Instead of one JSON body holding every message, the client sends a stream of
+frames that map directly onto columnar conversations (see columnar.py):
+
+    magic       b'IGC1'
+    frame       1-byte type, uint32 payload length, payload
+                (all integers little-endian)
+
+    'H' header    JSON: {"user_name": ..., "incremental": ...}
+    'S' strings   uint32 count, uint32[count] UTF-8 byte lengths, the bytes;
+                  appended to an upload-wide string table in which id 0 is
+                  always the empty string
+    'F' friend    JSON friend metadata (without messages); the 'M' frames that
+                  follow belong to this friend
+    'M' messages  uint32 n, then columns int64[n] timestamp_ms (0 if missing),
+                  uint32[n] sender string id, uint32[n] content string id,
+                  uint32[n] share link string id, uint8[n] ATTR_* bits
+    'E' end
+
+Strings must be sent before the first frame that references them. The body
+may be gzip (or, with the zstandard package installed, zstd) compressed as
+a whole, announced with Content-Encoding. It is decoded frame by frame, so
+only the columns and the distinct strings are ever held in memory.
+"""
+import gzip
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from columnar import FLAG_MEDIA, classify_share_link, sort_conversation
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+MAGIC = b'IGC1'
+FRAME_HEADER = struct.Struct('<cI')
+# Guards against corrupt lengths allocating huge buffers
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# Message attribute bits
+ATTR_MEDIA = 1   # message has 'photos' or 'videos'
+ATTR_SHARE = 2   # message has a share with a link
+
+MESSAGE_COLUMNS = (('timestamps', '<i8'), ('senders', '<u4'), ('contents', '<u4'), ('links', '<u4'), ('attrs', 'u1'))
+
+
+def open_upload_stream(stream, content_encoding):
+    """Wrap a request body stream in a decompressor; returns (stream, error)."""
+    encoding = (content_encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return stream, None
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb'), None
+    if encoding == 'zstd':
+        if zstandard is None:
+            return None, 'zstd uploads are not supported on this server; use gzip'
+        return zstandard.ZstdDecompressor().stream_reader(stream), None
+    return None, f'Unsupported Content-Encoding: {content_encoding}'
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            raise ValueError('Upload ended in the middle of a frame')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_strings(payload):
+    (count,) = struct.unpack_from('<I', payload)
+    lengths = np.frombuffer(payload, dtype='<u4', count=count, offset=4)
+    ends = (4 + 4 * count + np.cumsum(lengths, dtype=np.int64)).tolist()
+    if ends and ends[-1] != len(payload):
+        raise ValueError('String frame lengths do not match its size')
+    start = 4 + 4 * count
+    strings = []
+    for end in ends:
+        strings.append(payload[start:end].decode('utf-8'))
+        start = end
+    return strings
+
+
+def _read_messages(payload, string_count):
+    (n,) = struct.unpack_from('<I', payload)
+    if len(payload) != 4 + 21 * n:
+        raise ValueError('Message frame size does not match its message count')
+    columns = {}
+    offset = 4
+    for name, dtype in MESSAGE_COLUMNS:
+        columns[name] = np.frombuffer(payload, dtype=dtype, count=n, offset=offset)
+        offset += n * np.dtype(dtype).itemsize
+    for name in ('senders', 'contents', 'links'):
+        if n and int(columns[name].max()) >= string_count:
+            raise ValueError('Message frame refers to a string that was not sent')
+    return columns
+
+
+def _first_seen_codes(ids):
+    """Map ids to codes 0..k-1 in order of first appearance; returns (codes, distinct ids)."""
+    distinct, first_index, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    order = np.argsort(first_index, kind='stable')
+    rank = np.empty(len(distinct), dtype=np.int64)
+    rank[order] = np.arange(len(distinct))
+    return rank[inverse], distinct[order]
+
+
+def _build_conversation(chunks, strings):
+    """Assemble one friend's message frames into a time-ordered columnar conversation."""
+    columns = {
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.zeros(0, dtype=dtype)
+        for name, dtype in MESSAGE_COLUMNS
+    }
+    sender_codes, sender_ids = _first_seen_codes(columns['senders'])
+    # Seed the content ids with 0 so the empty string keeps content id 0
+    content_codes, content_ids = _first_seen_codes(np.concatenate(([0], columns['contents'])))
+    contents = [strings[i] for i in content_ids.tolist()]
+    offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in contents], out=offsets[1:])
+
+    attrs = columns['attrs']
+    flags = np.where((attrs & ATTR_MEDIA) != 0, FLAG_MEDIA, 0).astype(np.uint8)
+    is_share = (attrs & ATTR_SHARE) != 0
+    if is_share.any():
+        link_ids, link_index = np.unique(columns['links'][is_share], return_inverse=True)
+        link_flags = np.array([classify_share_link(strings[i]) for i in link_ids.tolist()], dtype=np.uint8)
+        flags[is_share] |= link_flags[link_index]
+
+    conversation = {
+        'timestamps': columns['timestamps'].astype(np.int64),
+        'senders': sender_codes.astype(np.int16),
+        'sender_names': [strings[i] for i in sender_ids.tolist()],
+        'content_ids': content_codes[1:].astype(np.int32),
+        'content_buffer': ''.join(contents),
+        'content_offsets': offsets,
+        'flags': flags,
+    }
+    return sort_conversation(conversation)
+
+
+def read_columnar_upload(stream):
+    """Decode an encoded upload from a binary stream.
+
+    Returns ({'user_name', 'incremental', 'friends', 'conversations'}, error),
+    conversations being keyed by friend id.
+    """
+    try:
+        if _read_exact(stream, len(MAGIC)) != MAGIC:
+            return None, 'Not a columnar upload (bad magic bytes)'
+        header = {}
+        strings = ['']
+        friends = []
+        conversations = {}
+        friend = None
+        chunks = []
+        while True:
+            frame_header = stream.read(FRAME_HEADER.size)
+            if not frame_header:
+                break
+            if len(frame_header) < FRAME_HEADER.size:
+                frame_header += _read_exact(stream, FRAME_HEADER.size - len(frame_header))
+            frame_type, length = FRAME_HEADER.unpack(frame_header)
+            if length > MAX_FRAME_BYTES:
+                return None, f'Frame of {length} bytes exceeds the {MAX_FRAME_BYTES} byte limit'
+            payload = _read_exact(stream, length)
+            if frame_type in (b'F', b'E') and friend is not None:
+                conversations[friend['id']] = _build_conversation(chunks, strings)
+                friend, chunks = None, []
+            if frame_type == b'H':
+                header = json.loads(payload)
+            elif frame_type == b'S':
+                strings.extend(_read_strings(payload))
+            elif frame_type == b'F':
+                friend = json.loads(payload)
+                friend.pop('messages', None)
+                friends.append(friend)
+            elif frame_type == b'M':
+                if friend is None:
+                    return None, 'Message frame before any friend frame'
+                chunks.append(_read_messages(payload, len(strings)))
+            elif frame_type == b'E':
+                break
+            else:
+                return None, f'Unknown frame type {frame_type!r}'
+        if friend is not None:
+            conversations[friend['id']] = _build_conversation(chunks, strings)
+    except (ValueError, KeyError, TypeError, struct.error, OSError, EOFError, zlib.error) as e:
+        # OSError, EOFError and zlib.error come from corrupt or truncated compressed bodies
+        return None, f'Invalid columnar upload: {e}'
+    return {
+        'user_name': header.get('user_name', 'User'),
+        'incremental': bool(header.get('incremental')),
+        'friends': friends,
+        'conversations': conversations,
+    }, None
+
@@ -0,0 +1,149 @@
+"""Bounded in-memory caches for sessions and per-friend analyses.
+
+LRUCache is a thread-safe, dict-like store that evicts least-recently-used
+entries once it holds more than max_entries, drops entries idle for longer
+than ttl_seconds, and, when max_rss_bytes is set, evicts until the process
+RSS (read through psutil) fits under the limit. Entry sizes are estimated
+when they are stored, so pressure eviction frees roughly the right amount
+in one pass instead of waiting for RSS to come down.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import psutil
+
+
+def estimate_size(obj, _seen=None):
+    """Rough deep size in bytes of plain dicts/lists/strings and NumPy arrays."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    return size
+
+
+def process_rss():
+    """Resident set size of this process in bytes."""
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class LRUCache:
+    """Dict-like LRU cache with entry, idle-time and RSS bounds."""
+
+    def __init__(self, name, max_entries, ttl_seconds=None, max_rss_bytes=None, on_evict=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_rss_bytes = max_rss_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # key -> [value, size, last_access]
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'size': 0, 'ttl': 0, 'memory': 0}
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry[2] > self.ttl_seconds
+
+    def _evict(self, key, reason):
+        value = self._entries.pop(key)[0]
+        self.evictions[reason] += 1
+        print(f"Evicting {self.name} entry {key} ({reason})")
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                self._evict(key, 'ttl')
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            entry[2] = time.time()
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            self._entries[key] = [value, size, time.time()]
+            self._entries.move_to_end(key)
+        self.trim()
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            value = self.get(key, self)
+            if value is self:
+                self[key] = value = default
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def trim(self):
+        """Apply the TTL, entry and RSS bounds; the most recent entry only ever expires."""
+        with self._lock:
+            now = time.time()
+            for key in [k for k, entry in self._entries.items() if self._expired(entry, now)]:
+                self._evict(key, 'ttl')
+            while len(self._entries) > max(self.max_entries, 1):
+                self._evict(next(iter(self._entries)), 'size')
+            if not self.max_rss_bytes:
+                return
+            excess = process_rss() - self.max_rss_bytes
+            while excess > 0 and len(self._entries) > 1:
+                key = next(iter(self._entries))
+                excess -= self._entries[key][1]
+                self._evict(key, 'memory')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'estimated_bytes': sum(entry[1] for entry in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': dict(self.evictions),
+            }
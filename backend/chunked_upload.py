@@ -0,0 +1,454 @@
+"""Chunked, resumable uploads of export ZIPs.
+
+An upload is initiated with the file's size, filled by chunks written at
+explicit offsets (each with its SHA-256), and finalized once every byte has
+arrived. Its state lives in CHUNKED_UPLOAD_DIR/<upload_id>/:
+    state.json    upload parameters and the byte ranges received so far
+    upload.zip    the file being assembled (sparse until complete)
+    members/      inbox message files parsed before the upload completed
+
+Chunks may arrive in any order, on any worker process, and an interrupted
+upload resumes by asking which ranges are still missing. While chunks arrive,
+scan_members() walks the ZIP's local file headers through the contiguous
+prefix received so far and hands each complete inbox message file to a
+handler, so chats are parsed while the rest of the export is still uploading.
+Members written with a data descriptor and no sizes in their local header
+can't be located early and are left for the central directory at finalize.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from session_store import load_conversation, save_conversation
+from zip_index import inbox_chat_folder
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; locks then only cover this process
+    fcntl = None
+
+CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR', os.path.join('uploads', 'chunked'))
+# Suggested chunk size handed to clients; chunks of any size are accepted
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 16 * 1024 * 1024 * 1024))
+# Uploads untouched for this long are deleted
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', 24 * 60 * 60))
+# Stale uploads are looked for at most this often
+EXPIRY_INTERVAL = 60
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+ZIP64_EXTRA_ID = 0x0001
+READ_SIZE = 256 * 1024
+
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+_last_expiry = 0
+
+
+def _upload_dir(upload_id):
+    return os.path.join(CHUNKED_UPLOAD_DIR, upload_id)
+
+
+def _data_path(upload_id):
+    return os.path.join(_upload_dir(upload_id), 'upload.zip')
+
+
+@contextmanager
+def _locked(upload_id, name='state', blocking=True):
+    """Exclusive lock on an upload across threads and processes; yields False if busy and not blocking."""
+    with _local_locks_lock:
+        local_lock = _local_locks.setdefault((upload_id, name), threading.Lock())
+    if not local_lock.acquire(blocking):
+        yield False
+        return
+    try:
+        with open(os.path.join(_upload_dir(upload_id), f"{name}.lock"), 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+    finally:
+        local_lock.release()
+
+
+def _save_state(state):
+    state['updated_at'] = time.time()
+    path = os.path.join(_upload_dir(state['upload_id']), 'state.json')
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_upload(upload_id):
+    """State of an upload, or None if it is unknown."""
+    if not upload_id or os.sep in upload_id or '/' in upload_id or upload_id.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(_upload_dir(upload_id), 'state.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def create_upload(filename, size, params):
+    """Start an upload of 'size' bytes; params (user name, flags) are kept for finalize.
+
+    Returns (state, error).
+    """
+    if not isinstance(size, int) or size <= 0:
+        return None, 'Upload size must be a positive number of bytes'
+    if size > MAX_UPLOAD_BYTES:
+        return None, f'Upload exceeds the {MAX_UPLOAD_BYTES} byte limit'
+    upload_id = str(uuid.uuid4())
+    os.makedirs(os.path.join(_upload_dir(upload_id), 'members'))
+    with open(_data_path(upload_id), 'wb') as f:
+        f.truncate(size)
+    state = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'size': size,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'params': params,
+        'status': 'receiving',
+        'received': [],
+        'scanned_offset': 0,
+        'scan_stopped': None,
+        'members_parsed': 0,
+        'created_at': datetime.now().isoformat(),
+        'session_id': None,
+        'job_id': None,
+    }
+    _save_state(state)
+    return state, None
+
+
+def _add_range(ranges, start, end):
+    """Merge [start, end) into a sorted list of disjoint ranges."""
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def missing_ranges(state):
+    """Byte ranges [start, end) not received yet."""
+    missing = []
+    position = 0
+    for start, end in state['received']:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < state['size']:
+        missing.append([position, state['size']])
+    return missing
+
+
+def _contiguous_prefix(state):
+    received = state['received']
+    return received[0][1] if received and received[0][0] == 0 else 0
+
+
+def write_chunk(upload_id, offset, data, checksum):
+    """Write a chunk at 'offset' after checking its SHA-256 hex digest; returns (state, error)."""
+    state = load_upload(upload_id)
+    if state is None:
+        return None, 'Upload not found'
+    if state['status'] != 'receiving':
+        return None, 'Upload already finalized'
+    if not checksum:
+        return None, 'Missing chunk checksum (X-Chunk-SHA256)'
+    if hashlib.sha256(data).hexdigest() != checksum.strip().lower():
+        return None, 'Chunk checksum mismatch; please resend the chunk'
+    if offset < 0 or not data or offset + len(data) > state['size']:
+        return None, f'Chunk at offset {offset} ({len(data)} bytes) lies outside the upload'
+    with open(_data_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+    with _locked(upload_id):
+        state = load_upload(upload_id)
+        state['received'] = _add_range(state['received'], offset, offset + len(data))
+        _save_state(state)
+    return state, None
+
+
+def upload_status(state):
+    """Public view of an upload: progress and the ranges still to send."""
+    missing = missing_ranges(state)
+    return {
+        'upload_id': state['upload_id'],
+        'status': state['status'],
+        'size': state['size'],
+        'chunk_size': state['chunk_size'],
+        'received_bytes': state['size'] - sum(end - start for start, end in missing),
+        'missing': missing,
+        'members_parsed': state['members_parsed'],
+        'session_id': state['session_id'],
+        'job_id': state['job_id'],
+    }
+
+
+def _zip64_sizes(extra, compress_size, file_size):
+    """Sizes from a local header's ZIP64 extra field, where the header holds 0xFFFFFFFF."""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, position)
+        if header_id == ZIP64_EXTRA_ID:
+            values = list(struct.unpack_from(f'<{length // 8}Q', extra, position + 4))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compress_size == 0xFFFFFFFF and values:
+                compress_size = values.pop(0)
+            return compress_size, file_size, True
+        position += 4 + length
+    return compress_size, file_size, False
+
+
+class _MemberStream(io.RawIOBase):
+    """Decompressed contents of a member located by its local header, CRC-checked at the end."""
+
+    def __init__(self, path, member):
+        if member['compress_type'] not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"Unsupported compression method {member['compress_type']}")
+        self._file = open(path, 'rb')
+        self._file.seek(member['data_start'])
+        self._remaining = member['compress_size']
+        self._decompressor = zlib.decompressobj(-15) if member['compress_type'] == zipfile.ZIP_DEFLATED else None
+        self._expected_crc = member['crc']
+        self._crc = 0
+        self._pending = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        if self._remaining > 0:
+            raw = self._file.read(min(READ_SIZE, self._remaining))
+            if not raw:
+                raise EOFError('ZIP member is truncated')
+            self._remaining -= len(raw)
+            self._pending = self._decompressor.decompress(raw) if self._decompressor else raw
+        else:
+            self._pending = self._decompressor.flush() if self._decompressor else b''
+            self._decompressor = None
+            self._done = not self._pending
+        self._crc = zlib.crc32(self._pending, self._crc)
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            self._fill()
+        if self._done and self._crc != self._expected_crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for {self._file.name}")
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def open_local_member(upload_id, member):
+    """Open a member found by scan_members() for reading."""
+    return io.BufferedReader(_MemberStream(_data_path(upload_id), member), READ_SIZE)
+
+
+def scan_members(upload_id, handle_member):
+    """Hand each inbox message file now fully received to handle_member(upload_id, member).
+
+    Members are visited in archive order through the contiguous prefix of the
+    upload; only one worker scans an upload at a time (others return at once).
+    """
+    with _locked(upload_id, 'scan', blocking=False) as acquired:
+        if not acquired:
+            return
+        state = load_upload(upload_id)
+        if state is None or state['status'] != 'receiving' or state['scan_stopped']:
+            return
+        prefix = _contiguous_prefix(state)
+        offset = state['scanned_offset']
+        parsed = 0
+        stopped = None
+        with open(_data_path(upload_id), 'rb') as f:
+            while offset + LOCAL_HEADER.size <= prefix:
+                f.seek(offset)
+                (signature, _, flags, method, _, _, crc, compress_size, file_size,
+                 name_length, extra_length) = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+                if signature != LOCAL_HEADER_SIGNATURE:
+                    stopped = 'end of members'  # the central directory, or something unexpected
+                    break
+                data_start = offset + LOCAL_HEADER.size + name_length + extra_length
+                if data_start > prefix:
+                    break
+                name = f.read(name_length).decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+                compress_size, file_size, zip64 = _zip64_sizes(f.read(extra_length), compress_size, file_size)
+                end = data_start + compress_size
+                if flags & FLAG_DATA_DESCRIPTOR:
+                    if not compress_size:
+                        stopped = 'data descriptor without sizes'
+                        break
+                    if end + 8 > prefix:
+                        break
+                    # The CRC is only known from the descriptor, whose signature is optional
+                    f.seek(end)
+                    first, second = struct.unpack('<II', f.read(8))
+                    has_signature = first == DATA_DESCRIPTOR_SIGNATURE
+                    crc = second if has_signature else first
+                    end += (4 if has_signature else 0) + (20 if zip64 else 12)
+                if end > prefix:
+                    break
+                if inbox_chat_folder(name) is not None and not flags & FLAG_ENCRYPTED:
+                    handle_member(upload_id, {
+                        'name': name,
+                        'offset': offset,
+                        'data_start': data_start,
+                        'compress_type': method,
+                        'compress_size': compress_size,
+                        'file_size': file_size,
+                        'crc': crc,
+                    })
+                    parsed += 1
+                offset = end
+        with _locked(upload_id):
+            state = load_upload(upload_id)
+            state['scanned_offset'] = offset
+            state['scan_stopped'] = stopped
+            state['members_parsed'] += parsed
+            _save_state(state)
+
+
+def save_member_partial(upload_id, member, participants, conversation, complete):
+    """Keep a message file parsed during the upload for use at finalize."""
+    directory = os.path.join(_upload_dir(upload_id), 'members', str(member['offset']))
+    scratch = f"{directory}.{uuid.uuid4().hex}"
+    os.makedirs(scratch)
+    with open(os.path.join(scratch, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'name': member['name'], 'crc': member['crc'], 'participants': participants,
+                   'complete': complete, 'has_conversation': conversation is not None}, f)
+    if conversation is not None:
+        save_conversation(os.path.join(scratch, 'conversation'), conversation)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(scratch, directory)
+
+
+def load_member_partial(upload_id, member):
+    """(participants, conversation, complete) saved for an indexed member, or None."""
+    directory = os.path.join(_upload_dir(upload_id), 'members', str(member['offset']))
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta['name'] != member['name'] or meta['crc'] != member['crc']:
+        return None
+    conversation = None
+    if meta['has_conversation']:
+        # Read into memory: the upload directory is deleted once the session is ingested
+        conversation = {
+            key: np.array(value) if isinstance(value, np.ndarray) else value
+            for key, value in load_conversation(os.path.join(directory, 'conversation')).items()
+        }
+    return meta['participants'], conversation, meta['complete']
+
+
+def finalize_upload(upload_id, destination, sha256=None):
+    """Check that every byte arrived (and the whole-file SHA-256 if given), move the file to
+    'destination' and close the upload.
+
+    Returns (state, error). The upload stays open if the file can't be moved, so finalizing
+    can be retried. Finalizing twice is an error, though the state (with the session it
+    became) is still returned.
+    """
+    if load_upload(upload_id) is None:
+        return None, 'Upload not found'
+    # Wait for a running scan so nothing reads the file or writes members once it is handed over
+    with _locked(upload_id, 'scan'), _locked(upload_id):
+        state = load_upload(upload_id)
+        if state['status'] != 'receiving':
+            return state, 'Upload already finalized'
+        missing = missing_ranges(state)
+        if missing:
+            return None, f"Upload incomplete: {sum(end - start for start, end in missing)} bytes missing"
+        if sha256:
+            digest = hashlib.sha256()
+            with open(_data_path(upload_id), 'rb') as f:
+                for block in iter(lambda: f.read(READ_SIZE), b''):
+                    digest.update(block)
+            if digest.hexdigest() != sha256.strip().lower():
+                return None, 'File checksum mismatch; the upload is corrupt'
+        try:
+            # Copies when CHUNKED_UPLOAD_DIR is on another filesystem than the destination
+            shutil.move(_data_path(upload_id), destination)
+        except OSError as e:
+            if os.path.exists(_data_path(upload_id)) and os.path.exists(destination):
+                os.remove(destination)
+            return None, f'Could not store the upload: {e}'
+        state['status'] = 'complete'
+        _save_state(state)
+        return state, None
+
+
+def record_upload_session(upload_id, session_id, job_id=None):
+    """Remember the session (and job) a finalized upload became, for retried finalize calls."""
+    if load_upload(upload_id) is None:
+        return
+    with _locked(upload_id):
+        state = load_upload(upload_id)
+        state['session_id'] = session_id
+        state['job_id'] = job_id
+        _save_state(state)
+
+
+def discard_upload_data(upload_id):
+    """Delete an upload's file and parsed members, keeping its state until it expires."""
+    if load_upload(upload_id) is None:
+        return
+    if os.path.exists(_data_path(upload_id)):
+        os.remove(_data_path(upload_id))
+    shutil.rmtree(os.path.join(_upload_dir(upload_id), 'members'), ignore_errors=True)
+
+
+def delete_upload(upload_id):
+    """Abort an upload and delete everything it holds."""
+    if load_upload(upload_id) is None:
+        return False
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+    return True
+
+
+def expire_uploads():
+    """Delete uploads untouched for UPLOAD_TTL_SECONDS (checked at most once a minute)."""
+    global _last_expiry
+    now = time.time()
+    if now - _last_expiry < EXPIRY_INTERVAL or not os.path.isdir(CHUNKED_UPLOAD_DIR):
+        return
+    _last_expiry = now
+    for upload_id in os.listdir(CHUNKED_UPLOAD_DIR):
+        state = load_upload(upload_id)
+        if state is not None and now - state.get('updated_at', now) > UPLOAD_TTL_SECONDS:
+            print(f"Expiring upload {upload_id}")
+            delete_upload(upload_id)
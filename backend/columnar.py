@@ -0,0 +1,224 @@
+"""Columnar message storage for conversations.
+
+Each conversation is converted once at ingest from a list of raw message
+dicts into a handful of NumPy arrays plus an interned string buffer, so the
+analysis code never has to walk per-message dicts again.
+
+A conversation is a plain dict:
+    'timestamps'      int64 array of timestamp_ms (0 when missing)
+    'senders'         int16 array of sender codes into 'sender_names'
+    'sender_names'    list of distinct sender names, indexed by code
+    'content_ids'     int32 array of ids into the interned content table
+                      (id 0 is always the empty string)
+    'content_buffer'  all distinct content strings concatenated
+    'content_offsets' int64 array, content id i spans
+                      content_buffer[offsets[i]:offsets[i + 1]]
+    'flags'           uint8 array of FLAG_* bits
+
+Conversations are put in time order once, when they are built, and every
+analysis relies on that. Set VERIFY_TIME_ORDER=1 to have analyses check it.
+"""
+import os
+from array import array
+
+import numpy as np
+
+# Message flag bits
+FLAG_MEDIA = 1          # message has 'photos' or 'videos'
+FLAG_SHARE = 2          # message has a share with a link
+FLAG_SHARE_POST = 4     # shared link points to an Instagram post
+FLAG_SHARE_REEL = 8     # shared link points to an Instagram reel
+FLAG_SHARE_STORY = 16   # shared link points to an Instagram story
+
+# Re-check the time order of conversations before analyzing them (an O(n) scan)
+VERIFY_TIME_ORDER = os.environ.get('VERIFY_TIME_ORDER', '0') == '1'
+
+
+def classify_share_link(link):
+    """Return the FLAG_SHARE_* bits for a shared link."""
+    if 'instagram.com/p/' in link or 'ig.me/p/' in link:
+        return FLAG_SHARE | FLAG_SHARE_POST
+    if 'instagram.com/reel/' in link or 'ig.me/reel/' in link:
+        return FLAG_SHARE | FLAG_SHARE_REEL
+    if 'instagram.com/stories/' in link:
+        return FLAG_SHARE | FLAG_SHARE_STORY
+    return FLAG_SHARE
+
+
+def message_flags(msg):
+    """Compute the flag bits for a single raw message dict."""
+    flags = 0
+    if 'photos' in msg or 'videos' in msg:
+        flags |= FLAG_MEDIA
+    share = msg.get('share')
+    if share and 'link' in share:
+        flags |= classify_share_link(share['link'])
+    return flags
+
+
+def new_conversation_builder():
+    """Start an incremental conversation build; feed it with append_message()."""
+    return {
+        'timestamps': array('q'),
+        'senders': array('h'),
+        'content_ids': array('i'),
+        'flags': array('B'),
+        'sender_codes': {},
+        'content_codes': {'': 0},
+    }
+
+
+def append_message(builder, msg):
+    """Add one raw message dict to a conversation builder."""
+    builder['timestamps'].append(msg.get('timestamp_ms', 0) or 0)
+
+    sender_codes = builder['sender_codes']
+    sender = msg.get('sender_name', '')
+    code = sender_codes.get(sender)
+    if code is None:
+        code = sender_codes[sender] = len(sender_codes)
+    builder['senders'].append(code)
+
+    content_codes = builder['content_codes']
+    content = msg.get('content') or ''
+    content_id = content_codes.get(content)
+    if content_id is None:
+        content_id = content_codes[content] = len(content_codes)
+    builder['content_ids'].append(content_id)
+
+    builder['flags'].append(message_flags(msg))
+
+
+def finish_conversation(builder):
+    """Freeze a builder into a time-ordered columnar conversation."""
+    contents = list(builder['content_codes'])
+    offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in contents], out=offsets[1:])
+
+    conversation = {
+        'timestamps': np.array(builder['timestamps'], dtype=np.int64),
+        'senders': np.array(builder['senders'], dtype=np.int16),
+        'sender_names': list(builder['sender_codes']),
+        'content_ids': np.array(builder['content_ids'], dtype=np.int32),
+        'content_buffer': ''.join(contents),
+        'content_offsets': offsets,
+        'flags': np.array(builder['flags'], dtype=np.uint8),
+    }
+    return sort_conversation(conversation)
+
+
+def build_conversation(messages):
+    """Convert a list of raw message dicts into a time-ordered columnar conversation."""
+    builder = new_conversation_builder()
+    for msg in messages:
+        append_message(builder, msg)
+    return finish_conversation(builder)
+
+
+def is_time_ordered(timestamps):
+    """Whether a timestamp array never decreases."""
+    return len(timestamps) < 2 or bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+
+def sort_conversation(conversation):
+    """Order a conversation's columns by timestamp, keeping ties in arrival order.
+
+    Exports hold each message file newest first, so the columns arrive as a
+    few sorted runs; NumPy's stable sort (timsort) merges those runs instead
+    of sorting from scratch, and input already in order is left untouched.
+    """
+    if is_time_ordered(conversation['timestamps']):
+        return conversation
+    order = np.argsort(conversation['timestamps'], kind='stable')
+    for column in ('timestamps', 'senders', 'content_ids', 'flags'):
+        conversation[column] = conversation[column][order]
+    return conversation
+
+
+def verify_time_order(conversation):
+    """With VERIFY_TIME_ORDER set, check a conversation is time-ordered, re-sorting it if not."""
+    if VERIFY_TIME_ORDER and not is_time_ordered(conversation['timestamps']):
+        print(f"Conversation with {message_count(conversation)} messages was not in time order; sorting it")
+        conversation = sort_conversation(dict(conversation))
+    return conversation
+
+
+def sender_code(conversation, name):
+    """Return the sender code for a name, or -1 if they never sent a message."""
+    try:
+        return conversation['sender_names'].index(name)
+    except ValueError:
+        return -1
+
+
+def conversation_contents(conversation):
+    """Return the interned content table as a list of strings, indexed by content id."""
+    buffer = conversation['content_buffer']
+    offsets = conversation['content_offsets'].tolist()
+    return [buffer[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def content_strings(conversation, content_ids):
+    """Strings for the given content ids, without materializing the whole table."""
+    ids = np.asarray(content_ids, dtype=np.int64)
+    starts = conversation['content_offsets'][ids].tolist()
+    ends = conversation['content_offsets'][ids + 1].tolist()
+    buffer = conversation['content_buffer']
+    return [buffer[start:end] for start, end in zip(starts, ends)]
+
+
+def message_count(conversation):
+    """Number of messages stored in a conversation."""
+    return len(conversation['timestamps'])
+
+
+def conversation_slice(conversation, start, stop):
+    """Messages start..stop of a conversation, sharing its content table and sender names."""
+    sliced = dict(conversation)
+    for column in ('timestamps', 'senders', 'content_ids', 'flags'):
+        sliced[column] = conversation[column][start:stop]
+    return sliced
+
+
+def conversation_since(conversation, since_ms):
+    """Messages of a time-ordered conversation from a millisecond timestamp on (messages without one are left out)."""
+    start = int(np.searchsorted(conversation['timestamps'], max(since_ms, 1)))
+    return conversation_slice(conversation, start, message_count(conversation))
+
+
+def concat_conversations(conversations):
+    """Join conversations, in order, into one time-ordered conversation.
+
+    Sender codes and content ids are renumbered in first-seen order and equal
+    timestamps keep their order, so the result equals building one conversation
+    from all of the messages in turn.
+    """
+    if not conversations:
+        return build_conversation([])
+    if len(conversations) == 1:
+        return conversations[0]
+    sender_codes = {}
+    content_codes = {'': 0}
+    columns = {column: [] for column in ('timestamps', 'senders', 'content_ids', 'flags')}
+    for conversation in conversations:
+        sender_map = np.array([sender_codes.setdefault(name, len(sender_codes))
+                               for name in conversation['sender_names']], dtype=np.int16)
+        content_map = np.array([content_codes.setdefault(content, len(content_codes))
+                                for content in conversation_contents(conversation)], dtype=np.int32)
+        columns['timestamps'].append(conversation['timestamps'])
+        columns['senders'].append(sender_map[conversation['senders']])
+        columns['content_ids'].append(content_map[conversation['content_ids']])
+        columns['flags'].append(conversation['flags'])
+    contents = list(content_codes)
+    offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in contents], out=offsets[1:])
+    conversation = {
+        'timestamps': np.concatenate(columns['timestamps']).astype(np.int64),
+        'senders': np.concatenate(columns['senders']).astype(np.int16),
+        'sender_names': list(sender_codes),
+        'content_ids': np.concatenate(columns['content_ids']).astype(np.int32),
+        'content_buffer': ''.join(contents),
+        'content_offsets': offsets,
+        'flags': np.concatenate(columns['flags']).astype(np.uint8),
+    }
+    return sort_conversation(conversation)
@@ -0,0 +1,100 @@
+"""Emoji counting over whole batches of message text.
+
+emoji.emoji_list() walks the emoji package's search tree one character at a
+time in Python for every message. Here the package's data is turned into a
+codepoint trie once at import. count_text_emojis() takes a batch of
+messages joined with newlines, and a regex finds the runs of characters
+that can start or belong to an emoji. Most runs are a single emoji and are
+counted with one dict lookup; the rest are split by a walk of the trie.
+Everything else (ASCII text, which is almost all of it) is skipped in C.
+
+Matches are the same as emoji.emoji_list(): from each position the longest
+path through the data is followed, and it counts only if it ends on a whole
+emoji (so the flag in an incomplete flag tag sequence is not counted). Emoji
+joined by zero-width joiners into a sequence that isn't in the data (non-RGI,
+e.g. a skin-toned couple) are matched by emoji.emoji_list() itself. Its
+tokenizer backtracks over those joins and can drop emoji between them, and
+copying that exactly is simpler than reimplementing it; such runs are rare.
+"""
+import re
+from collections import Counter
+
+import emoji
+
+_END = ''
+_ZWJ = '\u200d'
+
+# Runs of '©', '®' and characters from U+0300 up, with the digit, '#' or '*' that starts
+# a keycap emoji like 1️⃣; ASCII and accented Latin letters never belong to an emoji
+_CANDIDATE_RUNS = re.compile(r'[#*0-9]?[\u00a9\u00ae\u0300-\U0010ffff]+')
+
+
+def _build_trie(sequences):
+    trie = {}
+    for sequence in sequences:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[_END] = True
+    return trie
+
+
+def _char_ranges_pattern(sequences):
+    """Regex for runs of the characters used in emoji sequences, as codepoint ranges."""
+    codepoints = sorted({ord(char) for sequence in sequences for char in sequence})
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and codepoint == ranges[-1][1] + 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    parts = [re.escape(chr(low)) + ('-' + re.escape(chr(high)) if high > low else '') for low, high in ranges]
+    return re.compile('[' + ''.join(parts) + ']+')
+
+
+EMOJI_SEQUENCES = frozenset(emoji.EMOJI_DATA)
+_TRIE = _build_trie(EMOJI_SEQUENCES)
+# Splits non-emoji text (e.g. Cyrillic words) off candidate runs without a Python loop per character
+_EMOJI_CHAR_RUNS = _char_ranges_pattern(EMOJI_SEQUENCES)
+
+
+def _scan_run(run, counts):
+    """Count the emoji in a run of emoji characters without joiners, like emoji.emoji_list().
+
+    From each position the trie is followed as far as the run allows; the
+    characters walked count as an emoji only if they end a sequence there.
+    """
+    i, n = 0, len(run)
+    while i < n:
+        node = _TRIE.get(run[i])
+        if node is None:
+            i += 1
+            continue
+        j = i + 1
+        while j < n and run[j] in node:
+            node = node[run[j]]
+            j += 1
+        if _END in node:
+            counts[run[i:j]] += 1
+            i = j
+        else:
+            i += 1
+
+
+def count_text_emojis(text):
+    """Counter of the emoji in message texts joined with newlines, in first-seen order."""
+    counts = Counter()
+    for run in _CANDIDATE_RUNS.findall(text):
+        if run in EMOJI_SEQUENCES:
+            counts[run] += 1
+            continue
+        for part in _EMOJI_CHAR_RUNS.findall(run):
+            if part in EMOJI_SEQUENCES:
+                counts[part] += 1
+            elif _ZWJ in part:
+                # Non-RGI ZWJ sequence; the run is cut at characters that end the library's matching too
+                for match in emoji.emoji_list(part):
+                    counts[match['emoji']] += 1
+            else:
+                _scan_run(part, counts)
+    return counts
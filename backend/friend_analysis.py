@@ -0,0 +1,543 @@
+"""Per-friend analysis over a columnar conversation.
+
+Analysis runs in two steps: conversation_aggregates() reduces the messages to
+mergeable sketches (see sketches.py: counts, histograms, heavy-hitter word
+and emoji counts, response-time summaries and quantiles, plus the gap list), and
+analysis_from_aggregates() turns those into the analysis dict served by the
+API. Given the aggregates of an earlier export as 'previous',
+conversation_aggregates() only processes messages appended after it, and
+merge_aggregates() combines the aggregates of consecutive message ranges
+reduced independently (e.g. chunks of one long chat on different workers).
+
+The analysis is split into named sections (ANALYSIS_SECTIONS) that can be
+built on their own. Each needs only some of the sketches (SECTION_PARTS), so
+a request for e.g. the summary skips tokenizing and emoji counting entirely.
+
+This module only depends on NumPy, the emoji data and the columnar/analytics
+helpers so it can be imported cheaply by worker processes (see parallel.py).
+"""
+import copy
+from datetime import datetime
+
+import numpy as np
+
+from analytics import (
+    GAP_THRESHOLD_HOURS, categorize_response_times, gap_record, local_hours_and_weekdays,
+    local_timing_histograms, mean_response_time, merge_response_sketches, merge_timing_histograms,
+    new_response_sketch, new_timing_histograms, response_quantiles, response_sketch,
+    response_times_and_gaps, timing_from_histograms
+)
+from columnar import (
+    FLAG_MEDIA, FLAG_SHARE, FLAG_SHARE_POST, FLAG_SHARE_REEL, FLAG_SHARE_STORY,
+    content_strings, message_count, sender_code, verify_time_order
+)
+from emoji_scan import count_text_emojis
+from sketches import (
+    merge_heavy_hitters, merge_summaries, new_heavy_hitters, new_summary, top_items,
+    update_heavy_hitters, update_summary
+)
+from tokenizer import WORD_TOKENS, count_text_words, name_stopwords
+
+# Bumped whenever the aggregate layout changes; stored aggregates of another version are recomputed
+AGGREGATES_VERSION = 3
+SHARED_CONTENT_KEYS = ('instagram_posts', 'instagram_reels', 'instagram_stories', 'story_replies', 'other_links')
+# Sketches computed by conversation_aggregates()
+AGGREGATE_PARTS = ('words', 'emojis', 'lengths', 'timing', 'responses', 'shared')
+# Keys of the analysis dict, by section
+ANALYSIS_SECTIONS = {
+    'summary': ('friend', 'total_messages', 'your_messages', 'their_messages', 'your_percentage',
+                'their_percentage', 'first_message', 'last_message', 'friendship_duration_days',
+                'messages_per_day', 'gap_count', 'friendship_intensity', 'friendship_rating'),
+    'words': ('your_words', 'their_words'),
+    'emojis': ('your_emojis', 'their_emojis', 'your_emoji_count', 'their_emoji_count'),
+    'lengths': ('your_lengths', 'their_lengths'),
+    'timing': ('your_timing', 'their_timing'),
+    'responses': ('your_avg_response', 'their_avg_response', 'your_response_categories',
+                  'their_response_categories', 'your_response_count', 'their_response_count',
+                  'your_response_quantiles', 'their_response_quantiles'),
+    'shared': ('your_shared_content', 'their_shared_content'),
+    'gaps': ('conversation_gaps',),
+}
+# Sketches each section is built from; the summary scores response times and gaps
+SECTION_PARTS = {
+    'summary': ('responses',),
+    'words': ('words',),
+    'emojis': ('emojis',),
+    'lengths': ('lengths',),
+    'timing': ('timing',),
+    'responses': ('responses',),
+    'shared': ('shared',),
+    'gaps': ('responses',),
+}
+# Server-side friend fields never echoed back in an analysis
+PRIVATE_FRIEND_KEYS = ('messages', 'zip_path', 'file_path')
+
+
+def analyze_conversation(conversation, friend, user_name, sections=None):
+    """Analyze one friend's conversation with detailed insights.
+
+    Returns (analysis, error) like the Flask helpers. With 'sections', only
+    those sections are computed (see ANALYSIS_SECTIONS).
+    """
+    print(f"Analyzing columnar data for friend {friend['name']} (ID: {friend['id']})")
+    print(f"Found {message_count(conversation)} messages for {friend['name']}")
+    aggregates = conversation_aggregates(conversation, friend['name'], user_name, parts=section_parts(sections))
+    return analysis_from_aggregates(aggregates, friend, sections)
+
+
+def section_parts(sections=None):
+    """Aggregate parts needed to build the given sections (all sections if None)."""
+    if sections is None:
+        return AGGREGATE_PARTS
+    needed = {part for section in sections for part in SECTION_PARTS[section]}
+    return tuple(part for part in AGGREGATE_PARTS if part in needed)
+
+
+def missing_sections(analysis, sections):
+    """Sections whose keys are not all in a (possibly partial) analysis dict."""
+    return [section for section in sections if not all(key in analysis for key in ANALYSIS_SECTIONS[section])]
+
+
+def select_sections(analysis, sections):
+    """The keys of the given sections from an analysis dict."""
+    return {key: analysis[key] for section in sections for key in ANALYSIS_SECTIONS[section]}
+
+
+def aggregates_current(aggregates):
+    """Whether stored aggregates are complete and match this version and word tokenizer, so they can be extended."""
+    return (aggregates.get('version') == AGGREGATES_VERSION
+            and aggregates.get('word_tokens', 'ascii') == WORD_TOKENS
+            and set(aggregates.get('parts', AGGREGATE_PARTS)) == set(AGGREGATE_PARTS))
+
+
+def content_text_flags(contents):
+    """Story-reply, short (<= 10 chars stripped) and http-link flags of each text, as a 3 x n array."""
+    flags = []
+    for text in contents:
+        lower = text.lower()
+        flags.append((
+            'replied to your story' in lower or 'sent a story reply' in lower or 'replied to story' in lower,
+            len(text.strip()) <= 10,
+            text.startswith('http'),
+        ))
+    return np.array(flags, dtype=bool).reshape(len(contents), 3).T
+
+
+def new_side_aggregates():
+    return {
+        'words': new_heavy_hitters(),
+        'emojis': new_heavy_hitters(),
+        'emoji_count': 0,
+        'lengths': new_summary(),
+        'timing': new_timing_histograms(),
+        'responses': new_response_sketch(),
+        'shared': dict.fromkeys(SHARED_CONTENT_KEYS, 0),
+    }
+
+
+def side_aggregates(columns, parts, stopwords_set, into=None):
+    """Sketches of the given parts for one side of a conversation, added onto 'into' if given.
+
+    'columns' holds the inputs those parts need: 'text' (the side's message
+    contents joined with newlines), 'lengths', 'hours'/'weekdays' (the local
+    time of its timestamped messages), 'response_times' and 'shared' counts.
+    """
+    side = into if into is not None else new_side_aggregates()
+    if 'words' in parts:
+        update_heavy_hitters(side['words'], count_text_words(columns['text'], stopwords_set))
+    if 'emojis' in parts:
+        emoji_counts = count_text_emojis(columns['text'])
+        update_heavy_hitters(side['emojis'], emoji_counts)
+        side['emoji_count'] += sum(emoji_counts.values())
+    if 'lengths' in parts:
+        update_summary(side['lengths'], columns['lengths'])
+    if 'timing' in parts:
+        local_timing_histograms(columns['hours'], columns['weekdays'], side['timing'])
+    if 'responses' in parts:
+        response_sketch(columns['response_times'], side['responses'])
+    if 'shared' in parts:
+        for key in SHARED_CONTENT_KEYS:
+            side['shared'][key] += columns['shared'][key]
+    return side
+
+
+def merge_side_aggregates(earlier, later):
+    return {
+        'words': merge_heavy_hitters(earlier['words'], later['words']),
+        'emojis': merge_heavy_hitters(earlier['emojis'], later['emojis']),
+        'emoji_count': earlier['emoji_count'] + later['emoji_count'],
+        'lengths': merge_summaries(earlier['lengths'], later['lengths']),
+        'timing': merge_timing_histograms(earlier['timing'], later['timing']),
+        'responses': merge_response_sketches(earlier['responses'], later['responses']),
+        'shared': {key: earlier['shared'][key] + later['shared'][key] for key in SHARED_CONTENT_KEYS},
+    }
+
+
+def conversation_aggregates(conversation, friend_name, user_name, previous=None, parts=AGGREGATE_PARTS):
+    """Reduce a time-ordered conversation to mergeable totals.
+
+    With 'previous' (the aggregates of an earlier export), only messages after
+    its last timestamp are processed; messages sharing that exact timestamp
+    count as already seen. If the earlier export is not a prefix of this one
+    (e.g. messages were unsent since), everything is recomputed.
+
+    'parts' limits the work to some of the sketches; the others stay empty, so
+    such partial aggregates only serve to build sections and are never extended.
+    """
+    conversation = verify_time_order(conversation)
+    timestamps = conversation['timestamps']
+    senders = conversation['senders']
+    start = 0
+    partial = set(parts) != set(AGGREGATE_PARTS)
+    if previous is not None and (partial or not aggregates_current(previous)):
+        previous = None
+    # An empty earlier export has no last message to line up with; start afresh
+    if previous is not None and previous['total_messages'] == 0:
+        previous = None
+    if previous is not None:
+        start = int(np.searchsorted(timestamps, previous['last_timestamp'], side='right'))
+        if (start == 0 or start != previous['total_messages']
+                or conversation['sender_names'][int(senders[start - 1])] != previous['last_sender']):
+            print(f"Earlier export of {friend_name} is not a prefix of this one; recomputing")
+            previous, start = None, 0
+    # Sketches are extended in place; never touch the caller's copy
+    previous = copy.deepcopy(previous)
+    user_code = sender_code(conversation, user_name)
+    friend_code = sender_code(conversation, friend_name)
+    new_timestamps = timestamps[start:]
+    new_senders = senders[start:]
+    content_ids = conversation['content_ids'][start:]
+    flags = conversation['flags'][start:]
+    is_yours = new_senders == user_code
+    is_theirs = new_senders == friend_code
+    has_content = content_ids != 0
+    has_timestamp = new_timestamps != 0
+    # Add user/friend names and variants to stopwords for your/their words
+    your_stopwords = name_stopwords(user_name)
+    their_stopwords = name_stopwords(friend_name)
+    # --- Response time analysis ---
+    your_response_times, their_response_times, conversation_gaps = None, None, []
+    if 'responses' in parts:
+        # Start one message early so the reply to the last previously seen message is counted
+        pair_start = max(start - 1, 0)
+        your_response_times, their_response_times, conversation_gaps = response_times_and_gaps(
+            timestamps[pair_start:], senders[pair_start:], user_code, friend_code
+        )
+    # --- Per-message columns shared by every accumulator below ---
+    # Content strings are read once per distinct string; each side's text is joined
+    # from those, and text checks are gathered back to messages by index
+    needs_text = 'words' in parts or 'emojis' in parts
+    if needs_text or 'shared' in parts:
+        distinct_ids, message_content = np.unique(content_ids, return_inverse=True)
+        distinct_contents = content_strings(conversation, distinct_ids)
+    if 'shared' in parts:
+        story_reply_text, short_text, http_text = content_text_flags(distinct_contents)[:, message_content]
+    if 'lengths' in parts:
+        offsets = conversation['content_offsets']
+        lengths = offsets[content_ids + 1] - offsets[content_ids]
+    if 'timing' in parts:
+        # Local time is looked up once for all timestamped messages of both sides
+        hours, weekdays = local_hours_and_weekdays(new_timestamps[has_timestamp])
+        timed_senders = new_senders[has_timestamp]
+    def side_columns(mask, code, response_times, shared_mask):
+        columns = {'response_times': response_times}
+        with_content = mask & has_content
+        if needs_text:
+            columns['text'] = '\n'.join(map(distinct_contents.__getitem__, message_content[with_content].tolist()))
+        if 'lengths' in parts:
+            columns['lengths'] = lengths[with_content]
+        if 'timing' in parts:
+            timed = timed_senders == code
+            columns['hours'], columns['weekdays'] = hours[timed], weekdays[timed]
+        if 'shared' in parts:
+            columns['shared'] = shared_content_counts(shared_mask)
+        return columns
+    def shared_content_counts(mask):
+        msg_flags = flags[mask]
+        is_story_reply = story_reply_text[mask] | (((msg_flags & FLAG_MEDIA) != 0) & short_text[mask])
+        is_share = ~is_story_reply & ((msg_flags & FLAG_SHARE) != 0)
+        instagram_posts = int(np.count_nonzero(is_share & ((msg_flags & FLAG_SHARE_POST) != 0)))
+        instagram_reels = int(np.count_nonzero(is_share & ((msg_flags & FLAG_SHARE_REEL) != 0)))
+        instagram_stories = int(np.count_nonzero(is_share & ((msg_flags & FLAG_SHARE_STORY) != 0)))
+        shared_links = int(np.count_nonzero(is_share)) - instagram_posts - instagram_reels - instagram_stories
+        plain_links = int(np.count_nonzero(~is_story_reply & ~is_share & http_text[mask]))
+        return {
+            'instagram_posts': instagram_posts,
+            'instagram_reels': instagram_reels,
+            'instagram_stories': instagram_stories,
+            'story_replies': int(np.count_nonzero(is_story_reply)),
+            'other_links': shared_links + plain_links
+        }
+    # Words, lengths and timing count the friend's messages; shared content counts everything not yours
+    your_side = side_aggregates(
+        side_columns(is_yours, user_code, your_response_times, is_yours), parts,
+        your_stopwords, previous['you'] if previous else None
+    )
+    their_side = side_aggregates(
+        side_columns(is_theirs, friend_code, their_response_times, ~is_yours), parts,
+        their_stopwords, previous['them'] if previous else None
+    )
+    valid_timestamps = new_timestamps[has_timestamp]
+    first_timestamp = int(valid_timestamps.min()) if valid_timestamps.size else None
+    newest_timestamp = int(valid_timestamps.max()) if valid_timestamps.size else None
+    if previous is not None:
+        first_timestamp = previous['first_timestamp'] or first_timestamp
+        newest_timestamp = newest_timestamp or previous['newest_timestamp']
+    total_messages = message_count(conversation)
+    head_timestamp, head_sender = None, None
+    if previous is not None:
+        head_timestamp, head_sender = previous['head_timestamp'], previous['head_sender']
+    elif total_messages:
+        head_timestamp, head_sender = int(timestamps[0]), conversation['sender_names'][int(senders[0])]
+    return {
+        'version': AGGREGATES_VERSION,
+        'word_tokens': WORD_TOKENS,
+        'parts': list(parts),
+        'total_messages': total_messages,
+        'your_messages': int(np.count_nonzero(is_yours)) + (previous['your_messages'] if previous else 0),
+        'first_timestamp': first_timestamp,
+        'newest_timestamp': newest_timestamp,
+        # First and last message (which may lack a timestamp), for merging with neighbouring
+        # ranges; the last one is also the watermark for the next export
+        'head_timestamp': head_timestamp,
+        'head_sender': head_sender,
+        'last_timestamp': int(timestamps[-1]) if total_messages else None,
+        'last_sender': conversation['sender_names'][int(senders[-1])] if total_messages else None,
+        'you': your_side,
+        'them': their_side,
+        'gaps': (previous['gaps'] if previous else []) + conversation_gaps,
+    }
+
+
+def merge_aggregates(earlier, later, friend_name, user_name):
+    """Combine the aggregates of two consecutive, independently reduced message ranges.
+
+    The interval between the last message of 'earlier' and the first of 'later'
+    is counted here, as a response or a gap. Everything matches reducing both
+    ranges at once, except response-time means, whose float sums are added in
+    a different order and may differ in the last bit.
+    """
+    if not later['total_messages']:
+        return earlier
+    if not earlier['total_messages']:
+        return later
+    earlier_you = earlier['you']
+    earlier_them = earlier['them']
+    gaps = list(earlier['gaps'])
+    start_ms, end_ms = earlier['last_timestamp'], later['head_timestamp']
+    if start_ms > 0 and end_ms > 0:
+        diff_seconds = (end_ms - start_ms) / 1000
+        diff_hours = diff_seconds / 3600
+        if diff_hours > GAP_THRESHOLD_HOURS:
+            gaps.append(gap_record(start_ms, end_ms, diff_hours))
+        elif earlier['last_sender'] != later['head_sender']:
+            # Count the reply before the later range's responses, as a single pass would
+            reply = np.array([diff_seconds])
+            if later['head_sender'] == user_name:
+                earlier_you = dict(earlier_you, responses=response_sketch(reply, copy.deepcopy(earlier_you['responses'])))
+            elif later['head_sender'] == friend_name:
+                earlier_them = dict(earlier_them, responses=response_sketch(reply, copy.deepcopy(earlier_them['responses'])))
+    first_timestamps = [t for t in (earlier['first_timestamp'], later['first_timestamp']) if t is not None]
+    newest_timestamps = [t for t in (earlier['newest_timestamp'], later['newest_timestamp']) if t is not None]
+    return {
+        'version': AGGREGATES_VERSION,
+        'word_tokens': WORD_TOKENS,
+        'parts': [part for part in earlier.get('parts', AGGREGATE_PARTS) if part in later.get('parts', AGGREGATE_PARTS)],
+        'total_messages': earlier['total_messages'] + later['total_messages'],
+        'your_messages': earlier['your_messages'] + later['your_messages'],
+        'first_timestamp': min(first_timestamps, default=None),
+        'newest_timestamp': max(newest_timestamps, default=None),
+        'head_timestamp': earlier['head_timestamp'],
+        'head_sender': earlier['head_sender'],
+        'last_timestamp': later['last_timestamp'],
+        'last_sender': later['last_sender'],
+        'you': merge_side_aggregates(earlier_you, later['you']),
+        'them': merge_side_aggregates(earlier_them, later['them']),
+        'gaps': gaps + later['gaps'],
+    }
+
+
+def analysis_from_aggregates(aggregates, friend, sections=None):
+    """Build the analysis dict (and error) from conversation_aggregates().
+
+    With 'sections', only those sections' keys are built; the aggregates need
+    to include their SECTION_PARTS.
+    """
+    if not aggregates['total_messages']:
+        return None, "No messages found for this friend"
+    analysis = {}
+    for section in (ANALYSIS_SECTIONS if sections is None else sections):
+        analysis.update(SECTION_BUILDERS[section](aggregates, friend))
+    return analysis, None
+
+
+def public_friend(friend):
+    """The friend dict without raw messages or server paths."""
+    return {key: value for key, value in friend.items() if key not in PRIVATE_FRIEND_KEYS}
+
+
+def average_response_times(aggregates):
+    """Mean response times (yours, theirs), None for a side without responses."""
+    return mean_response_time(aggregates['you']['responses']), mean_response_time(aggregates['them']['responses'])
+
+
+def friendship_intensity(total_messages, your_messages, avg_response, gap_count):
+    """Friendship intensity score (0-100) from volume, response speed, gaps and balance."""
+    score = 0
+    # Message volume (0-30 points)
+    if total_messages >= 1000:
+        score += 30
+    elif total_messages >= 500:
+        score += 20
+    elif total_messages >= 200:
+        score += 15
+    elif total_messages >= 100:
+        score += 10
+    elif total_messages >= 50:
+        score += 5
+    # Response speed (0-25 points)
+    if avg_response is not None:
+        if avg_response < 300:  # <5 min
+            score += 25
+        elif avg_response < 1800:  # <30 min
+            score += 20
+        elif avg_response < 3600:  # <1 hour
+            score += 15
+        elif avg_response < 86400:  # <1 day
+            score += 10
+    # Conversation gaps (0-25 points)
+    if gap_count == 0:
+        score += 25
+    elif gap_count <= 3:
+        score += 20
+    elif gap_count <= 10:
+        score += 15
+    elif gap_count <= 20:
+        score += 10
+    # Balance (0-20 points)
+    if total_messages > 0:
+        balance = abs(50 - (your_messages / total_messages * 100))
+        if balance <= 10:
+            score += 20
+        elif balance <= 20:
+            score += 15
+        elif balance <= 30:
+            score += 10
+    return min(score, 100)
+
+
+def summary_section(aggregates, friend):
+    total_messages = aggregates['total_messages']
+    your_messages = aggregates['your_messages']
+    their_messages = total_messages - your_messages
+    first_timestamp = aggregates['first_timestamp']
+    last_timestamp = aggregates['newest_timestamp']
+    friendship_duration_days = 0
+    if first_timestamp and last_timestamp and last_timestamp > first_timestamp:
+        duration_seconds = (last_timestamp - first_timestamp) / 1000
+        friendship_duration_days = duration_seconds / 86400
+    messages_per_day = total_messages / friendship_duration_days if friendship_duration_days > 0 else 0
+    # Use both your and their response times
+    avg_your_response, avg_their_response = average_response_times(aggregates)
+    if avg_your_response is not None and avg_their_response is not None:
+        avg_response = (avg_your_response + avg_their_response) / 2
+    elif avg_your_response is not None:
+        avg_response = avg_your_response
+    else:
+        avg_response = avg_their_response
+    gap_count = len(aggregates['gaps'])
+    intensity = friendship_intensity(total_messages, your_messages, avg_response, gap_count)
+    return {
+        'friend': public_friend(friend),
+        'total_messages': total_messages,
+        'your_messages': your_messages,
+        'their_messages': their_messages,
+        'your_percentage': (your_messages / total_messages * 100) if total_messages > 0 else 0,
+        'their_percentage': (their_messages / total_messages * 100) if total_messages > 0 else 0,
+        'first_message': datetime.fromtimestamp(first_timestamp / 1000).isoformat() if first_timestamp else None,
+        'last_message': datetime.fromtimestamp(last_timestamp / 1000).isoformat() if last_timestamp else None,
+        'friendship_duration_days': friendship_duration_days,
+        'messages_per_day': messages_per_day,
+        'gap_count': gap_count,
+        'friendship_intensity': intensity,
+        'friendship_rating': 'Very High' if intensity >= 80 else 'High' if intensity >= 60 else 'Moderate' if intensity >= 40 else 'Low'
+    }
+
+
+def words_section(aggregates, friend):
+    return {
+        'your_words': top_items(aggregates['you']['words'], 15),
+        'their_words': top_items(aggregates['them']['words'], 15),
+    }
+
+
+def emojis_section(aggregates, friend):
+    yours, theirs = aggregates['you'], aggregates['them']
+    return {
+        'your_emojis': top_items(yours['emojis'], 10),
+        'their_emojis': top_items(theirs['emojis'], 10),
+        'your_emoji_count': yours['emoji_count'],
+        'their_emoji_count': theirs['emoji_count'],
+    }
+
+
+def lengths_section(aggregates, friend):
+    def side_lengths(lengths):
+        return {
+            'avg_length': lengths['sum'] / lengths['count'] if lengths['count'] else 0,
+            'longest': lengths['max'] or 0
+        }
+    return {
+        'your_lengths': side_lengths(aggregates['you']['lengths']),
+        'their_lengths': side_lengths(aggregates['them']['lengths']),
+    }
+
+
+def timing_section(aggregates, friend):
+    return {
+        'your_timing': timing_from_histograms(aggregates['you']['timing']),
+        'their_timing': timing_from_histograms(aggregates['them']['timing']),
+    }
+
+
+def responses_section(aggregates, friend):
+    your_responses = aggregates['you']['responses']
+    their_responses = aggregates['them']['responses']
+    avg_your_response, avg_their_response = average_response_times(aggregates)
+    return {
+        'your_avg_response': avg_your_response if avg_your_response is not None else 0,
+        'their_avg_response': avg_their_response if avg_their_response is not None else 0,
+        'your_response_categories': categorize_response_times(your_responses),
+        'their_response_categories': categorize_response_times(their_responses),
+        'your_response_count': your_responses['summary']['count'],
+        'their_response_count': their_responses['summary']['count'],
+        'your_response_quantiles': response_quantiles(your_responses),
+        'their_response_quantiles': response_quantiles(their_responses),
+    }
+
+
+def shared_section(aggregates, friend):
+    def shared_content(shared):
+        content = dict(shared)
+        content['total_shared'] = sum(shared[key] for key in SHARED_CONTENT_KEYS)
+        return content
+    return {
+        'your_shared_content': shared_content(aggregates['you']['shared']),
+        'their_shared_content': shared_content(aggregates['them']['shared']),
+    }
+
+
+def gaps_section(aggregates, friend):
+    return {'conversation_gaps': aggregates['gaps']}
+
+
+SECTION_BUILDERS = {
+    'summary': summary_section,
+    'words': words_section,
+    'emojis': emojis_section,
+    'lengths': lengths_section,
+    'timing': timing_section,
+    'responses': responses_section,
+    'shared': shared_section,
+    'gaps': gaps_section,
+}
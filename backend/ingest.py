@@ -0,0 +1,178 @@
+"""Reading an export's chats into columnar conversations.
+
+Shared by the web backend and the command-line extractor. Message files are
+streamed (see json_stream.py) straight into columnar conversations; only
+one-to-one chats are kept, and group chats are skipped as soon as their
+participant list is read.
+
+extract_friends_from_zip() turns an indexed export ZIP (see zip_index.py)
+into the friend list and conversations. The account owner's name is taken
+as given, or inferred as the participant found in the most chats.
+"""
+from collections import Counter
+
+from columnar import append_message, concat_conversations, finish_conversation, message_count, new_conversation_builder
+from json_stream import iter_chat_file
+from zip_index import open_member
+
+
+def pick_friend_name(participants, user_name, added_names):
+    """First participant that isn't the user and hasn't been listed yet."""
+    for participant in participants:
+        if 'name' in participant:
+            friend_name = participant['name']
+            if friend_name != user_name and friend_name not in added_names:
+                return friend_name
+    return None
+
+
+def infer_user_name(chat_participants):
+    """The account owner: the name found in the most chats' participant lists (None if there are none).
+
+    The owner takes part in every chat of their export. Instagram lists the owner
+    last, which settles ties (e.g. an export, or a single file, with one chat).
+    """
+    counts = Counter()
+    listed_last = Counter()
+    for names in chat_participants:
+        names = [name for name in dict.fromkeys(names) if name]
+        counts.update(names)
+        if names:
+            listed_last[names[-1]] += 1
+    if not counts:
+        return None
+    return max(counts, key=lambda name: (counts[name], listed_last[name]))
+
+
+def ingest_chat_file(open_file, member, participants=None):
+    """Stream one message file into a columnar conversation.
+
+    Returns (participants, conversation, complete). Unless the chat's participants
+    are already known, reading stops at a group chat's participant list, leaving
+    conversation None and complete False.
+    """
+    builder = new_conversation_builder()
+    with open_file(member) as f:
+        for key, value in iter_chat_file(f):
+            if key == 'message':
+                append_message(builder, value)
+            elif key == 'participants' and participants is None:
+                participants = value
+                # Only one-to-one chats are analyzed; stop reading group chats early
+                if len(participants) != 2:
+                    return participants, None, False
+    return participants, finish_conversation(builder), True
+
+
+def ingest_chat_files(open_file, members, parsed_member=None):
+    """Stream a chat's message files into one columnar conversation.
+
+    Returns (participants, conversation); conversation is None for group chats
+    or files without participants. Errors in the first file propagate, later
+    files are skipped with a warning. parsed_member(member) may supply files
+    parsed ahead of time as ingest_chat_file() results.
+    """
+    participants = None
+    parts = []
+    for index, member in enumerate(members):
+        try:
+            parsed = parsed_member(member) if parsed_member else None
+            # A file parsed on its own may have stopped early at participants the chat doesn't use
+            if parsed is None or (participants is not None and not parsed[2]):
+                parsed = ingest_chat_file(open_file, member, participants)
+        except Exception as e:
+            if index == 0:
+                raise
+            print(f"Error reading {member['name']}: {e}")
+            continue
+        if participants is None:
+            participants = parsed[0]
+            if participants is not None and len(participants) != 2:
+                return participants, None
+        parts.append(parsed[1])
+    if participants is None or len(participants) != 2:
+        return participants, None
+    return participants, concat_conversations(parts)
+
+
+def extract_friends_from_zip(zip_index, user_name=None, progress=None, parsed_member=None):
+    """Read every chat of an indexed ZIP once, building the friend list and columnar conversations.
+
+    Returns (friends, conversations, user_name): friend dicts in chat folder
+    order, conversations by friend id, and the account owner's name, inferred
+    from the chats' participants when not given. Each chat's participant names
+    are recorded in zip_index['participants'].
+
+    progress(**fields), if given, is called before each chat folder with
+    friends_done/friends_total/friends_found and bytes_done/bytes_total (in
+    compressed bytes); an exception it raises stops the read. Message files
+    already parsed (e.g. while a chunked upload arrived) are taken from
+    parsed_member.
+    """
+    chat_folders = zip_index['chat_folders']
+
+    def open_indexed(member):
+        return open_member(zip_index, member)
+
+    def report(**fields):
+        if progress:
+            progress(**fields)
+
+    chats = []  # (folder, files, participants, conversation), participants None for unreadable chats
+    bytes_total = sum(m['compress_size'] for files in chat_folders.values() for m in files)
+    bytes_done = 0
+    report(friends_total=len(chat_folders), bytes_total=bytes_total)
+
+    for folders_done, (folder_name, files) in enumerate(chat_folders.items(), 1):
+        bytes_done += sum(m['compress_size'] for m in files)
+        report(friends_done=folders_done - 1, friends_found=len(chats), bytes_done=bytes_done)
+
+        # Participants are read from message_1.json, like the client-side path
+        if not files[0]['name'].endswith('/message_1.json'):
+            continue
+
+        try:
+            participants, conversation = ingest_chat_files(open_indexed, files, parsed_member)
+        except Exception as e:
+            print(f"Error reading {files[0]['name']}: {e}")
+            chats.append((folder_name, files, None, None))
+            continue
+        if participants is not None:
+            zip_index['participants'][folder_name] = [p.get('name', '') for p in participants]
+        if conversation is not None:
+            chats.append((folder_name, files, participants, conversation))
+
+    if not user_name:
+        user_name = infer_user_name(zip_index['participants'].values())
+
+    friends = []
+    conversations = {}
+    added_names = set()
+    for folder_name, files, participants, conversation in chats:
+        if participants is None:
+            # Fallback: use folder name
+            friend_name = folder_name.replace('_', ' ').title()
+            total_messages = 'Unknown'
+        else:
+            friend_name = pick_friend_name(participants, user_name, added_names)
+            total_messages = message_count(conversation)
+
+        if friend_name is None or friend_name in added_names:
+            continue
+
+        friend_id = len(friends)
+        friends.append({
+            'id': friend_id,
+            'name': friend_name,
+            'chat_folder': folder_name,
+            'message_files': len(files),
+            'total_messages': total_messages,
+            'analyzed': False,
+            'zip_path': zip_index['zip_path']  # Store ZIP path for later access
+        })
+        added_names.add(friend_name)
+        if conversation is not None:
+            conversations[friend_id] = conversation
+
+    report(friends_done=len(chat_folders), friends_found=len(friends))
+    return friends, conversations, user_name
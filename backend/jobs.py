@@ -0,0 +1,276 @@
+"""Background jobs for long-running uploads and analyses.
+
+Jobs run on a local thread pool so requests can return a job id at once.
+A job is a plain dict; handlers registered per kind receive it and report
+progress through update_progress(), which is also where cancellation is
+checked. Job parameters must be JSON-serializable.
+
+When JOB_QUEUE_DIR is set, every job is mirrored to <dir>/<job_id>.json
+(and its result to <job_id>.result.json). Other processes can then read
+job status, and jobs whose owning process has died while they were queued
+or running are picked up again by resume_queued_jobs().
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psutil
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_DIR = os.environ.get('JOB_QUEUE_DIR')
+# Minimum seconds between on-disk progress snapshots
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+FINISHED_STATUSES = ('complete', 'failed', 'cancelled')
+
+jobs = {}
+_jobs_lock = threading.Lock()
+_handlers = {}
+_cancel_hooks = {}
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+_resumed = False
+
+if JOB_QUEUE_DIR:
+    os.makedirs(JOB_QUEUE_DIR, exist_ok=True)
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+
+def register_job_handler(kind, handler, on_cancel=None):
+    """Register handler(job, **params) for a job kind; its return value becomes the result.
+
+    on_cancel(**params) cleans up after a job that is cancelled before it starts;
+    a running handler cleans up itself when update_progress() raises JobCancelled.
+    """
+    _handlers[kind] = handler
+    if on_cancel is not None:
+        _cancel_hooks[kind] = on_cancel
+
+
+def _current_owner():
+    # Looked up per job rather than at import, which may happen in a preloading parent;
+    # the start time guards against pid reuse
+    return {'pid': os.getpid(), 'started': psutil.Process().create_time()}
+
+
+def _job_file(job_id, suffix='.json'):
+    return os.path.join(JOB_QUEUE_DIR, f"{job_id}{suffix}")
+
+
+def _persist(job, force=False):
+    """Mirror a job's state to the queue directory (throttled unless forced)."""
+    if not JOB_QUEUE_DIR:
+        return
+    now = time.time()
+    if not force and now - job.get('_flushed_at', 0) < PROGRESS_FLUSH_INTERVAL:
+        return
+    job['_flushed_at'] = now
+    state = {k: v for k, v in job.items() if k != 'result' and not k.startswith('_')}
+    tmp_path = _job_file(job['id'], '.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _job_file(job['id']))
+    if job['status'] == 'complete' and job.get('result') is not None:
+        with open(_job_file(job['id'], '.result.json'), 'w', encoding='utf-8') as f:
+            json.dump(job['result'], f)
+
+
+def _cancel_requested(job):
+    # Other processes cancel jobs they don't own by leaving a <job_id>.cancel marker
+    if not job['cancel_requested'] and JOB_QUEUE_DIR and os.path.exists(_job_file(job['id'], '.cancel')):
+        job['cancel_requested'] = True
+    return job['cancel_requested']
+
+
+def _finish(job, status):
+    job['status'] = status
+    job['finished_at'] = time.time()
+    _persist(job, force=True)
+    if JOB_QUEUE_DIR and os.path.exists(_job_file(job['id'], '.cancel')):
+        os.remove(_job_file(job['id'], '.cancel'))
+
+
+def _run(job):
+    if _cancel_requested(job):
+        if job['kind'] in _cancel_hooks:
+            _cancel_hooks[job['kind']](**job['params'])
+        _finish(job, 'cancelled')
+        return
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    _persist(job, force=True)
+    try:
+        job['result'] = _handlers[job['kind']](job, **job['params'])
+        status = 'complete'
+    except JobCancelled:
+        status = 'cancelled'
+    except Exception as e:
+        print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        status = 'failed'
+        job['error'] = str(e)
+    _finish(job, status)
+
+
+def submit_job(kind, params, session_id=None, job_id=None):
+    """Queue a job for a registered kind and return the job dict."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = {
+        'id': job_id or str(uuid.uuid4()),
+        'kind': kind,
+        'params': params,
+        'session_id': session_id,
+        'status': 'queued',
+        'created_at': datetime.now().isoformat(),
+        'started_at': None,
+        'finished_at': None,
+        'progress': {'friends_done': 0, 'friends_total': 0, 'bytes_done': 0, 'bytes_total': 0},
+        'cancel_requested': False,
+        'owner': _current_owner(),
+        'error': None,
+        'result': None,
+    }
+    with _jobs_lock:
+        jobs[job['id']] = job
+    _persist(job, force=True)
+    _executor.submit(_run, job)
+    return job
+
+
+def run_in_background(function, *args):
+    """Run a short task on the job pool without a job record, for work nothing polls."""
+    return _executor.submit(function, *args)
+
+
+def update_progress(job, **progress):
+    """Record handler progress and raise JobCancelled if cancellation was requested."""
+    if job is None:
+        return
+    job['progress'].update(progress)
+    _persist(job)
+    if _cancel_requested(job):
+        raise JobCancelled(job['id'])
+
+
+def _load_persisted(job_id):
+    if not JOB_QUEUE_DIR or not os.path.exists(_job_file(job_id)):
+        return None
+    with open(_job_file(job_id), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_job(job_id):
+    """Look up a job in memory, falling back to the on-disk queue."""
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    return job if job is not None else _load_persisted(job_id)
+
+
+def get_job_result(job_id):
+    """Result of a completed job, or None."""
+    job = get_job(job_id)
+    if not job or job['status'] != 'complete':
+        return None
+    if job.get('result') is not None:
+        return job['result']
+    result_path = _job_file(job_id, '.result.json') if JOB_QUEUE_DIR else None
+    if result_path and os.path.exists(result_path):
+        with open(result_path, encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def cancel_job(job_id):
+    """Request cancellation; returns False if the job is unknown or already finished."""
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        # Owned by another process: leave a marker for its next progress check
+        state = _load_persisted(job_id)
+        if state is None or state['status'] in FINISHED_STATUSES:
+            return False
+        open(_job_file(job_id, '.cancel'), 'w').close()
+        return True
+    if job['status'] in FINISHED_STATUSES:
+        return False
+    job['cancel_requested'] = True
+    _persist(job, force=True)
+    return True
+
+
+def forget_session_jobs(session_id):
+    """Drop a session's finished jobs (and their results) from memory."""
+    with _jobs_lock:
+        for job_id in [j for j, job in jobs.items() if job.get('session_id') == session_id]:
+            if jobs[job_id]['status'] in FINISHED_STATUSES:
+                del jobs[job_id]
+
+
+def job_status(job):
+    """Public view of a job: status, progress and an ETA in seconds when it can be estimated."""
+    progress = dict(job['progress'])
+    eta_seconds = None
+    if job['status'] == 'running' and job.get('started_at'):
+        if progress['bytes_total']:
+            fraction = progress['bytes_done'] / progress['bytes_total']
+        elif progress['friends_total']:
+            fraction = progress['friends_done'] / progress['friends_total']
+        else:
+            fraction = 0
+        if fraction > 0:
+            elapsed = time.time() - job['started_at']
+            eta_seconds = elapsed * (1 - fraction) / fraction
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'session_id': job.get('session_id'),
+        'status': job['status'],
+        'progress': progress,
+        'eta_seconds': eta_seconds,
+        'created_at': job['created_at'],
+        'error': job.get('error'),
+    }
+
+
+def _owner_alive(owner):
+    try:
+        return psutil.Process(owner['pid']).create_time() == owner['started']
+    except (psutil.Error, KeyError, TypeError):
+        return False
+
+
+def resume_queued_jobs():
+    """Requeue persisted jobs whose process died before they finished; runs once per process."""
+    global _resumed
+    if _resumed or not JOB_QUEUE_DIR:
+        return []
+    _resumed = True
+    resumed = []
+    for name in sorted(os.listdir(JOB_QUEUE_DIR)):
+        if not name.endswith('.json') or name.endswith('.result.json'):
+            continue
+        path = os.path.join(JOB_QUEUE_DIR, name)
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (state['status'] in FINISHED_STATUSES or state['kind'] not in _handlers
+                or _owner_alive(state.get('owner'))):
+            continue
+        # Claim the job atomically so two restarted workers don't both run it
+        claim_path = f"{path}.{os.getpid()}.claim"
+        try:
+            os.rename(path, claim_path)
+        except OSError:
+            continue
+        os.remove(claim_path)
+        print(f"Resuming {state['kind']} job {state['id']}")
+        resumed.append(submit_job(state['kind'], state['params'], state.get('session_id'), job_id=state['id']))
+    return resumed
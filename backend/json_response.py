@@ -0,0 +1,103 @@
+"""Fast JSON encoding and compression for API responses.
+
+FastJSONProvider replaces Flask's stdlib-based JSON provider, so every
+jsonify() goes through it. orjson is used when it is installed; otherwise
+the stdlib encoder. Either way NumPy arrays and scalars serialise as lists
+and numbers, and the body is encoded to bytes only once.
+
+compress_response() is an after_request hook that gzip- or, with the brotli
+package installed, brotli-compresses JSON bodies for clients that accept it.
+"""
+import gzip
+import json
+import os
+
+import numpy as np
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Smaller bodies are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    """Encode what the stdlib encoder can't: NumPy arrays and scalars."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(data):
+    """UTF-8 JSON for API data."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps_bytes()."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s) if orjson is not None else json.loads(s)
+
+    def response(self, *args, **kwargs):
+        if args and kwargs:
+            raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+        data = args[0] if len(args) == 1 else args or kwargs or None
+        return self._app.response_class(dumps_bytes(data), mimetype='application/json')
+
+
+def accepted_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header, preferring brotli."""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encoding):
+    """Compress a JSON response body for the client's Accept-Encoding, if worthwhile."""
+    if (response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding(accept_encoding)
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
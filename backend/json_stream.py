@@ -0,0 +1,142 @@
+"""Incremental reader for Instagram message_N.json files.
+
+A chat file is one JSON object whose 'messages' array holds every message.
+iter_chat_file() walks that object as a stream of events so the array is
+never materialized: it yields ('message', dict) for each element of
+'messages' and (key, value) for every other top-level key (participants,
+title, ...).
+
+ijson is used when it is installed; otherwise a stdlib fallback decodes one
+value at a time with json.JSONDecoder.raw_decode over a sliding text buffer.
+"""
+import codecs
+import json
+
+try:
+    import ijson
+except ImportError:  # optional dependency
+    ijson = None
+
+CHUNK_SIZE = 256 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+_DECODER = json.JSONDecoder()
+
+
+def iter_chat_file(fileobj):
+    """Yield (key, value) events for a chat file opened in binary mode."""
+    if ijson is not None:
+        return _iter_chat_file_ijson(fileobj)
+    return _iter_chat_file_stdlib(fileobj)
+
+
+def _iter_chat_file_ijson(fileobj):
+    builder = None
+    building = None
+    for prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == building and event in ('end_map', 'end_array'):
+                if building == 'messages.item':
+                    yield 'message', builder.value
+                else:
+                    yield building, builder.value
+                builder = building = None
+        elif prefix == 'messages.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            building = prefix
+        elif prefix in ('', 'messages') or '.' in prefix:
+            continue
+        elif event in ('start_map', 'start_array'):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            building = prefix
+        elif event != 'map_key':
+            yield prefix, value
+
+
+class _TextStream:
+    """Sliding window over a UTF-8 byte stream for raw_decode."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk; returns False once the stream is exhausted."""
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(CHUNK_SIZE)
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        if not chunk:
+            self.eof = True
+            self.buffer += self.decoder.decode(b'', final=True)
+            return False
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ('' at end of stream)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} in chat file")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                # Only trust a value once its delimiter is buffered; "1" may still become "1.5"
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def _iter_chat_file_stdlib(fileobj):
+    stream = _TextStream(fileobj)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == 'messages' and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.pos += 1
+            else:
+                while True:
+                    yield 'message', stream.value()
+                    if stream.peek() == ',':
+                        stream.pos += 1
+                    else:
+                        stream.expect(']')
+                        break
+        else:
+            yield key, stream.value()
+        if stream.peek() == ',':
+            stream.pos += 1
+        else:
+            stream.expect('}')
+            return
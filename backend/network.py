@@ -0,0 +1,74 @@
+"""Social network rankings over friends' analyses.
+
+Shared by the web backend and the command-line extractor. Each friend's
+analysis (at least its summary and responses sections, see
+friend_analysis.py) is added to leaderboards, categories and totals as it
+completes, and network_from_rankings() gives the network for the analyses
+added so far.
+"""
+import os
+
+from rankings import Leaderboard
+
+# Network leaderboards: metric over a friend's analysis, and whether larger values rank first
+NETWORK_LEADERBOARDS = {
+    'most_messages': (lambda analysis: analysis['total_messages'], True),
+    'most_balanced': (lambda analysis: abs(50 - analysis['your_percentage']), False),
+    'longest_friendships': (lambda analysis: analysis['friendship_duration_days'], True),
+    'fastest_responses': (lambda analysis: analysis['their_avg_response'], False),
+}
+NETWORK_CATEGORIES = ('best_friends', 'close_friends', 'regular_friends', 'occasional_friends', 'distant_friends')
+# Friends listed per network leaderboard
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 10))
+
+
+def friendship_category(analysis):
+    """Network category of a friendship from its message volume and rate."""
+    total_messages = analysis['total_messages']
+    messages_per_day = total_messages / analysis['friendship_duration_days'] if analysis['friendship_duration_days'] > 0 else 0
+    if total_messages >= 1000 and messages_per_day >= 2:
+        return 'best_friends'
+    if total_messages >= 500 and messages_per_day >= 1:
+        return 'close_friends'
+    if total_messages >= 200 and messages_per_day >= 0.5:
+        return 'regular_friends'
+    if total_messages >= 50:
+        return 'occasional_friends'
+    return 'distant_friends'
+
+
+def new_network_rankings():
+    """Leaderboards, categories and totals that friends' analyses are added to as they complete."""
+    return {
+        'leaderboards': {
+            name: Leaderboard(metric, LEADERBOARD_SIZE, largest)
+            for name, (metric, largest) in NETWORK_LEADERBOARDS.items()
+        },
+        'categories': {name: [] for name in NETWORK_CATEGORIES},
+        'total_friends': 0,
+        'total_messages': 0,
+    }
+
+
+def add_to_network_rankings(rankings, analysis, position):
+    """Add a friend's analysis; position (e.g. the friend's index in the session) orders ties."""
+    for leaderboard in rankings['leaderboards'].values():
+        leaderboard.add(analysis, order=position)
+    rankings['categories'][friendship_category(analysis)].append((position, analysis))
+    rankings['total_friends'] += 1
+    rankings['total_messages'] += analysis['total_messages']
+
+
+def network_from_rankings(rankings):
+    """The network analysis for the analyses added so far."""
+    network = {
+        'total_friends': rankings['total_friends'],
+        'total_messages': rankings['total_messages'],
+    }
+    for name, leaderboard in rankings['leaderboards'].items():
+        network[name] = leaderboard.top()
+    network['categories'] = {
+        name: [analysis for _, analysis in sorted(entries, key=lambda entry: entry[0])]
+        for name, entries in rankings['categories'].items()
+    }
+    return network
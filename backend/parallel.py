@@ -0,0 +1,175 @@
+"""Process pool for fanning per-friend analyses out across cores.
+
+Workers are handed columnar conversations (a few compact NumPy arrays plus
+one interned content buffer), never raw message lists. Results are
+returned in input order, or by iter_analyses() as soon as each finishes
+(e.g. to stream network results), tagged with their input index.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from columnar import conversation_slice, message_count, verify_time_order
+from friend_analysis import analyze_conversation, conversation_aggregates, merge_aggregates
+
+# Number of analysis processes; 1 disables the pool and analyzes in-process
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+# Longer conversations are aggregated in chunks of this many messages on separate workers
+AGGREGATE_CHUNK_MESSAGES = int(os.environ.get('AGGREGATE_CHUNK_MESSAGES', 200000))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_analysis_pool():
+    """Return the shared analysis pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn avoids forking a threaded server process
+            _pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def set_analysis_workers(workers):
+    """Change the number of analysis processes (e.g. from a command-line option), restarting the pool."""
+    global ANALYSIS_WORKERS
+    shutdown_analysis_pool()
+    ANALYSIS_WORKERS = max(int(workers), 1)
+
+
+def shutdown_analysis_pool():
+    """Stop the shared pool; the next parallel analysis starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def analyze_task(task):
+    """Run one (conversation, friend, user_name) analysis, never raising."""
+    conversation, friend, user_name = task
+    try:
+        return analyze_conversation(conversation, friend, user_name)
+    except Exception as e:
+        print(f"Error analyzing friend {friend.get('name')}: {e}")
+        return None, f"Error analyzing friend: {e}"
+
+
+def aggregate_task(task):
+    """Reduce one (conversation, friend_name, user_name, previous) task to (aggregates, error), never raising."""
+    conversation, friend_name, user_name, previous = task
+    try:
+        return conversation_aggregates(conversation, friend_name, user_name, previous), None
+    except Exception as e:
+        print(f"Error aggregating friend {friend_name}: {e}")
+        return None, f"Error analyzing friend: {e}"
+
+
+def analyze_conversations(tasks, workers=None, progress=None):
+    """Analyze (conversation, friend, user_name) tasks and return (analysis, error) pairs in input order.
+
+    progress(done, total) is called as each task finishes; an exception it raises
+    (e.g. a cancelled job) cancels the tasks that haven't started and propagates.
+    """
+    return run_tasks(analyze_task, tasks, workers, progress)
+
+
+def iter_analyses(tasks, workers=None):
+    """Analyze tasks like analyze_conversations, yielding (index, (analysis, error)) as each one finishes."""
+    return iter_tasks(analyze_task, tasks, workers)
+
+
+def aggregate_conversations(tasks, workers=None, progress=None):
+    """Run aggregate_task over tasks like analyze_conversations, returning (aggregates, error) pairs.
+
+    With more than one worker, conversations longer than AGGREGATE_CHUNK_MESSAGES
+    that don't extend earlier aggregates are split into chunks that are reduced
+    in parallel and merged back in order.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    chunk_tasks = []
+    owners = []  # index into tasks of each chunk task
+    for index, (conversation, friend_name, user_name, previous) in enumerate(tasks):
+        count = message_count(conversation)
+        if workers <= 1 or previous is not None or count <= AGGREGATE_CHUNK_MESSAGES:
+            chunk_tasks.append(tasks[index])
+            owners.append(index)
+            continue
+        # Chunks have to be consecutive time ranges
+        conversation = verify_time_order(conversation)
+        for start in range(0, count, AGGREGATE_CHUNK_MESSAGES):
+            chunk = conversation_slice(conversation, start, start + AGGREGATE_CHUNK_MESSAGES)
+            chunk_tasks.append((chunk, friend_name, user_name, None))
+            owners.append(index)
+
+    def report_progress(done, total):
+        # Report in whole tasks, as callers count friends
+        progress(done * len(tasks) // total, len(tasks))
+
+    chunk_results = run_tasks(aggregate_task, chunk_tasks, workers, report_progress if progress else None)
+    results = [None] * len(tasks)
+    for index, (aggregates, error) in zip(owners, chunk_results):
+        if results[index] is None:
+            results[index] = (aggregates, error)
+        elif results[index][1] is None:
+            if error:
+                results[index] = (None, error)
+            else:
+                _, friend_name, user_name, _ = tasks[index]
+                results[index] = (merge_aggregates(results[index][0], aggregates, friend_name, user_name), None)
+    return results
+
+
+def run_tasks(function, tasks, workers=None, progress=None):
+    """Map a task function over tasks (conversation first) on the pool, in input order."""
+    results = [None] * len(tasks)
+    finished = iter_tasks(function, tasks, workers)
+    try:
+        for done, (index, result) in enumerate(finished, 1):
+            results[index] = result
+            if progress:
+                progress(done, len(tasks))
+    finally:
+        finished.close()
+    return results
+
+
+def iter_tasks(function, tasks, workers=None):
+    """Map a task function over tasks on the pool, yielding (index, result) as each one finishes.
+
+    Closing the generator early cancels the tasks that haven't started.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        for index, task in enumerate(tasks):
+            yield index, function(task)
+        return
+
+    # Submit the longest conversations first so they don't straggle at the end
+    order = sorted(range(len(tasks)), key=lambda i: message_count(tasks[i][0]), reverse=True)
+    futures = {}
+    finished = set()
+    try:
+        pool = get_analysis_pool()
+        futures = {pool.submit(function, tasks[i]): i for i in order}
+        for future in as_completed(futures):
+            result = future.result()
+            finished.add(futures[future])
+            yield futures[future], result
+    except BrokenProcessPool as e:
+        print(f"Analysis pool failed ({e}); falling back to serial analysis")
+        shutdown_analysis_pool()
+        for index, task in enumerate(tasks):
+            if index not in finished:
+                yield index, function(task)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
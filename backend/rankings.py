@@ -0,0 +1,55 @@
+"""Top-k leaderboards over per-friend analyses.
+
+A Leaderboard keeps the k best items by a metric in a bounded heap, so
+ranking n friends costs O(n log k) instead of a full sort per metric, and
+items can be added one at a time as their analyses complete, with the
+current top k available at any point.
+
+Ties rank by an explicit order (by default, the order items were added), so
+top() matches sorted(items, key=metric, reverse=largest)[:k] over the items
+in that order, wherever they arrived from.
+"""
+import heapq
+
+
+class Leaderboard:
+    """The top k items by metric(item), largest or smallest first.
+
+    metric returns a number, or None to leave the item out.
+    """
+
+    def __init__(self, metric, k=10, largest=True):
+        self.metric = metric
+        self.k = k
+        self.largest = largest
+        self._heap = []  # (key, item); the root holds the worst item kept
+        self._added = 0
+
+    def add(self, item, order=None):
+        """Offer an item; among equal values, lower order ranks first (default: first added)."""
+        value = self.metric(item)
+        arrival = self._added
+        self._added += 1
+        if value is None or self.k <= 0:
+            return
+        # Arrival breaks ties between equal orders, so items themselves are never compared
+        key = (value if self.largest else -value, -(arrival if order is None else order), -arrival)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (key, item))
+        elif key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (key, item))
+
+    def top(self):
+        """The ranked items, best first."""
+        return [item for _, item in sorted(self._heap, reverse=True)]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def top_k(items, metric, k=10, largest=True):
+    """sorted(items, key=metric, reverse=largest)[:k] in O(n log k); items where metric is None are left out."""
+    leaderboard = Leaderboard(metric, k, largest)
+    for item in items:
+        leaderboard.add(item)
+    return leaderboard.top()
@@ -0,0 +1,279 @@
+"""Pluggable stores for sessions, cached analyses and per-account aggregates.
+
+SESSION_STORE selects the backend:
+    memory  per-process LRUCache (the default; one worker process only)
+    disk    SQLite under SESSION_STORE_DIR with each session's columnar
+            conversations saved as .npy files and memory-mapped on load, so
+            any worker process can serve any session
+
+Both backends are dict-like (get, [], setdefault, pop, keys, trim, stats).
+Values read from the disk backend are fresh copies: a session changed after
+it was read must be stored again for other workers to see the change.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+
+import numpy as np
+
+from cache import LRUCache, estimate_size
+
+SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
+SESSION_STORE_DIR = os.environ.get('SESSION_STORE_DIR', 'session_store')
+# Last-access times are written back at most this often per entry
+TOUCH_INTERVAL = 60
+
+ARRAY_COLUMNS = ('timestamps', 'senders', 'content_ids', 'content_offsets', 'flags')
+
+
+def save_conversation(directory, conversation):
+    """Write a columnar conversation as .npy columns plus its strings."""
+    os.makedirs(directory)
+    for column in ARRAY_COLUMNS:
+        np.save(os.path.join(directory, f"{column}.npy"), np.ascontiguousarray(conversation[column]))
+    with open(os.path.join(directory, 'content.txt'), 'w', encoding='utf-8', newline='') as f:
+        f.write(conversation['content_buffer'])
+    with open(os.path.join(directory, 'senders.json'), 'w', encoding='utf-8') as f:
+        json.dump(conversation['sender_names'], f)
+
+
+def load_conversation(directory):
+    """Load a saved conversation, memory-mapping its columns read-only."""
+    conversation = {
+        column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+        for column in ARRAY_COLUMNS
+    }
+    with open(os.path.join(directory, 'content.txt'), encoding='utf-8', newline='') as f:
+        conversation['content_buffer'] = f.read()
+    with open(os.path.join(directory, 'senders.json'), encoding='utf-8') as f:
+        conversation['sender_names'] = json.load(f)
+    return conversation
+
+
+class SavedConversations(Mapping):
+    """friend id -> conversation, loaded from disk on first access."""
+
+    def __init__(self, directory, friend_ids):
+        self.directory = directory
+        self.friend_ids = list(friend_ids)
+        self._loaded = {}
+
+    def __getitem__(self, friend_id):
+        if friend_id not in self._loaded:
+            if friend_id not in self.friend_ids:
+                raise KeyError(friend_id)
+            self._loaded[friend_id] = load_conversation(os.path.join(self.directory, str(friend_id)))
+        return self._loaded[friend_id]
+
+    def __iter__(self):
+        return iter(self.friend_ids)
+
+    def __len__(self):
+        return len(self.friend_ids)
+
+    def __contains__(self, friend_id):
+        return friend_id in self.friend_ids
+
+
+class SqliteCache:
+    """Dict-like JSON store in SQLite, bounded by entry count and idle time."""
+
+    def __init__(self, name, path, max_entries, ttl_seconds=None, on_evict=None):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'size': 0, 'ttl': 0, 'memory': 0}
+        with self._connection() as db:
+            db.execute(f"CREATE TABLE IF NOT EXISTS {self.name} "
+                       "(key TEXT PRIMARY KEY, data TEXT, size INTEGER, last_access REAL)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_access ON {self.name} (last_access)")
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def encode(self, key, value):
+        return json.dumps(value)
+
+    def decode(self, key, data):
+        return json.loads(data)
+
+    def discard(self, key):
+        """Remove anything kept outside the table for an entry."""
+
+    def _expired(self, last_access, now):
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _evict(self, key, data, reason):
+        with self._connection() as db:
+            deleted = db.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,)).rowcount
+        if not deleted:
+            return  # another worker got there first
+        self.evictions[reason] += 1
+        print(f"Evicting {self.name} entry {key} ({reason})")
+        value = self.decode(key, data)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+        self.discard(key)
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            f"SELECT data, last_access FROM {self.name} WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is not None and self._expired(row[1], now):
+            self._evict(key, row[0], 'ttl')
+            row = None
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if now - row[1] > TOUCH_INTERVAL:
+            with self._connection() as db:
+                db.execute(f"UPDATE {self.name} SET last_access = ? WHERE key = ?", (now, key))
+        return self.decode(key, row[0])
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        data = self.encode(key, value)
+        with self._connection() as db:
+            db.execute(f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?, ?)",
+                       (key, data, estimate_size(value), time.time()))
+        self.trim()
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, self)
+        if value is self:
+            self[key] = value = default
+        return value
+
+    def pop(self, key, default=None):
+        value = self.get(key, self)
+        with self._connection() as db:
+            db.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        if value is self:
+            return default
+        self.discard(key)
+        return value
+
+    def __contains__(self, key):
+        return self._connection().execute(
+            f"SELECT 1 FROM {self.name} WHERE key = ?", (key,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    def keys(self):
+        return [row[0] for row in self._connection().execute(f"SELECT key FROM {self.name}")]
+
+    def clear(self):
+        for key in self.keys():
+            self.pop(key)
+
+    def trim(self):
+        """Apply the TTL and entry bounds; the most recent entry only ever expires."""
+        db = self._connection()
+        if self.ttl_seconds is not None:
+            cutoff = time.time() - self.ttl_seconds
+            for key, data in db.execute(
+                    f"SELECT key, data FROM {self.name} WHERE last_access < ?", (cutoff,)).fetchall():
+                self._evict(key, data, 'ttl')
+        excess = len(self) - max(self.max_entries, 1)
+        if excess > 0:
+            for key, data in db.execute(
+                    f"SELECT key, data FROM {self.name} ORDER BY last_access LIMIT ?", (excess,)).fetchall():
+                self._evict(key, data, 'size')
+
+    def stats(self):
+        entries, size = self._connection().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.name}").fetchone()
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'estimated_bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': dict(self.evictions),
+        }
+
+
+class DiskSessionStore(SqliteCache):
+    """Sessions in SQLite with their conversations as memory-mapped .npy files."""
+
+    def __init__(self, name, root, max_entries, ttl_seconds=None, on_evict=None):
+        self.root = root
+        os.makedirs(os.path.join(root, 'conversations'), exist_ok=True)
+        super().__init__(name, os.path.join(root, 'sessions.db'), max_entries, ttl_seconds, on_evict)
+
+    def _conversations_dir(self, key):
+        return os.path.join(self.root, 'conversations', key)
+
+    def encode(self, key, value):
+        conversations = value.get('conversations') or {}
+        directory = self._conversations_dir(key)
+        already_saved = isinstance(conversations, SavedConversations) and conversations.directory == directory
+        if not already_saved:
+            # Write into a scratch directory and swap it in so readers never see a partial session
+            scratch = f"{directory}.{uuid.uuid4().hex}"
+            os.makedirs(scratch)
+            for friend_id, conversation in conversations.items():
+                save_conversation(os.path.join(scratch, str(friend_id)), conversation)
+            if os.path.exists(directory):
+                retired = f"{directory}.{uuid.uuid4().hex}.old"
+                os.rename(directory, retired)
+                shutil.rmtree(retired, ignore_errors=True)
+            os.rename(scratch, directory)
+        data = {k: v for k, v in value.items() if k != 'conversations'}
+        data['conversation_ids'] = list(conversations)
+        return json.dumps(data)
+
+    def decode(self, key, data):
+        value = json.loads(data)
+        value['conversations'] = SavedConversations(self._conversations_dir(key), value.pop('conversation_ids'))
+        return value
+
+    def discard(self, key):
+        shutil.rmtree(self._conversations_dir(key), ignore_errors=True)
+
+
+def make_session_store(max_entries, ttl_seconds=None, max_rss_bytes=None, on_evict=None):
+    """Session store for the configured backend (RSS bounds only apply in memory)."""
+    if SESSION_STORE == 'disk':
+        return DiskSessionStore('session', SESSION_STORE_DIR, max_entries, ttl_seconds, on_evict)
+    return LRUCache('session', max_entries, ttl_seconds, max_rss_bytes=max_rss_bytes, on_evict=on_evict)
+
+
+def make_analysis_store(max_entries, ttl_seconds=None):
+    """Analysis cache for the configured backend."""
+    if SESSION_STORE == 'disk':
+        os.makedirs(SESSION_STORE_DIR, exist_ok=True)
+        return SqliteCache('analysis', os.path.join(SESSION_STORE_DIR, 'sessions.db'), max_entries, ttl_seconds)
+    return LRUCache('analysis', max_entries, ttl_seconds)
+
+
+def make_account_store(max_entries):
+    """Store of per-chat analysis aggregates kept across uploads (no idle expiry)."""
+    if SESSION_STORE == 'disk':
+        os.makedirs(SESSION_STORE_DIR, exist_ok=True)
+        return SqliteCache('account', os.path.join(SESSION_STORE_DIR, 'sessions.db'), max_entries)
+    return LRUCache('account', max_entries)
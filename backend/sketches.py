@@ -0,0 +1,175 @@
+"""Mergeable aggregate types for per-friend statistics.
+
+Every sketch is a plain JSON-serializable dict with two operations:
+update_*() folds more values in, in order, and merge_*() combines partials
+computed independently over consecutive ranges (shards, chunks or time
+windows). Updating in order reproduces a single pass exactly; merging is
+exact too, except that a summary's float sum is added in a different order
+and may differ from the single-pass sum in the last bit.
+
+    summary        count / sum / min / max
+    histogram      fixed bins plus the order bins were first seen in, which
+                   breaks peak ties like Counter.most_common()
+    heavy hitters  item counts bounded to a capacity; only the least frequent
+                   items are ever dropped, and the largest dropped count is
+                   kept as the error bound
+    log histogram  values in logarithmic buckets, for quantiles within
+                   LOG_BUCKET_GAMMA relative error
+"""
+import math
+from collections import Counter
+
+import numpy as np
+
+# Heavy hitters keep up to twice this many items between prunes
+HEAVY_HITTER_CAPACITY = 10000
+# Consecutive log buckets differ by this ratio (about 1% relative error)
+LOG_BUCKET_GAMMA = 1.02
+_LOG_GAMMA = math.log(LOG_BUCKET_GAMMA)
+
+
+def new_summary():
+    return {'count': 0, 'sum': 0, 'min': None, 'max': None}
+
+
+def update_summary(summary, values):
+    """Fold values (list or array) into a summary, summing left to right in Python."""
+    values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+    if not values:
+        return summary
+    summary['count'] += len(values)
+    summary['sum'] = sum(values, summary['sum'])
+    low, high = min(values), max(values)
+    summary['min'] = low if summary['min'] is None else min(summary['min'], low)
+    summary['max'] = high if summary['max'] is None else max(summary['max'], high)
+    return summary
+
+
+def merge_summaries(earlier, later):
+    if not later['count']:
+        return dict(earlier)
+    if not earlier['count']:
+        return dict(later)
+    return {
+        'count': earlier['count'] + later['count'],
+        'sum': earlier['sum'] + later['sum'],
+        'min': min(earlier['min'], later['min']),
+        'max': max(earlier['max'], later['max']),
+    }
+
+
+def summary_mean(summary):
+    """Mean of a summary, or None when it is empty."""
+    if not summary['count']:
+        return None
+    return summary['sum'] / summary['count']
+
+
+def new_histogram(bins):
+    return {'counts': [0] * bins, 'order': []}
+
+
+def update_histogram(histogram, bin_indices):
+    """Count integer bin indices (array) into a histogram."""
+    bin_indices = np.asarray(bin_indices, dtype=np.int64)
+    if not bin_indices.size:
+        return histogram
+    counts = np.bincount(bin_indices, minlength=len(histogram['counts'])).tolist()
+    histogram['counts'] = [a + b for a, b in zip(histogram['counts'], counts)]
+    present, first_index = np.unique(bin_indices, return_index=True)
+    seen = set(histogram['order'])
+    histogram['order'] += [b for b in present[np.argsort(first_index, kind='stable')].tolist() if b not in seen]
+    return histogram
+
+
+def merge_histograms(earlier, later):
+    seen = set(earlier['order'])
+    return {
+        'counts': [a + b for a, b in zip(earlier['counts'], later['counts'])],
+        'order': earlier['order'] + [b for b in later['order'] if b not in seen],
+    }
+
+
+def histogram_peak(histogram):
+    """Bin with the highest count, ties going to the earliest seen; None if empty."""
+    if not histogram['order']:
+        return None
+    # max() keeps the first of equal counts
+    return max(histogram['order'], key=histogram['counts'].__getitem__)
+
+
+def new_heavy_hitters():
+    return {'counts': {}, 'dropped': 0}
+
+
+def _prune_heavy_hitters(heavy_hitters):
+    counts = heavy_hitters['counts']
+    if len(counts) <= 2 * HEAVY_HITTER_CAPACITY:
+        return heavy_hitters
+    ranked = Counter(counts).most_common()
+    heavy_hitters['dropped'] = max(heavy_hitters['dropped'], ranked[HEAVY_HITTER_CAPACITY][1])
+    # Keep first-seen order among the survivors so ties still break the same way
+    kept = {item for item, _ in ranked[:HEAVY_HITTER_CAPACITY]}
+    heavy_hitters['counts'] = {item: count for item, count in counts.items() if item in kept}
+    return heavy_hitters
+
+
+def update_heavy_hitters(heavy_hitters, counts):
+    """Add a Counter (or mapping) of item counts, in its iteration order."""
+    merged = Counter(heavy_hitters['counts'])
+    merged.update(counts)
+    heavy_hitters['counts'] = dict(merged)
+    return _prune_heavy_hitters(heavy_hitters)
+
+
+def merge_heavy_hitters(earlier, later):
+    merged = update_heavy_hitters({'counts': dict(earlier['counts']), 'dropped': earlier['dropped']}, later['counts'])
+    merged['dropped'] = max(merged['dropped'], later['dropped'])
+    return merged
+
+
+def top_items(heavy_hitters, n):
+    """The n most frequent items as (item, count) pairs, like Counter.most_common(n)."""
+    return Counter(heavy_hitters['counts']).most_common(n)
+
+
+def new_log_histogram():
+    return {'buckets': {}, 'zeros': 0}
+
+
+def update_log_histogram(histogram, values):
+    """Bucket non-negative values (array) by their logarithm."""
+    values = np.asarray(values, dtype=np.float64)
+    positive = values[values > 0]
+    histogram['zeros'] += int(values.size - positive.size)
+    if positive.size:
+        indices, counts = np.unique(np.ceil(np.log(positive) / _LOG_GAMMA).astype(np.int64), return_counts=True)
+        buckets = histogram['buckets']
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            # String keys so the sketch survives a JSON round trip unchanged
+            buckets[str(index)] = buckets.get(str(index), 0) + count
+    return histogram
+
+
+def merge_log_histograms(earlier, later):
+    buckets = dict(earlier['buckets'])
+    for index, count in later['buckets'].items():
+        buckets[index] = buckets.get(index, 0) + count
+    return {'buckets': buckets, 'zeros': earlier['zeros'] + later['zeros']}
+
+
+def log_histogram_quantile(histogram, q):
+    """Approximate q-quantile (0..1) of the bucketed values, or None if empty."""
+    total = histogram['zeros'] + sum(histogram['buckets'].values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = histogram['zeros']
+    if rank < seen:
+        return 0.0
+    for index in sorted(int(i) for i in histogram['buckets']):
+        seen += histogram['buckets'][str(index)]
+        if rank < seen:
+            # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+            return 2 * LOG_BUCKET_GAMMA ** index / (LOG_BUCKET_GAMMA + 1)
+    return None
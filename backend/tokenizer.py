@@ -0,0 +1,69 @@
+"""Word tokenizing and counting for word-frequency analysis.
+
+Shared by the web analysis (friend_analysis.py) and the command-line
+extractor. Stopword sets are frozen at import and the word patterns are
+compiled once. count_text_words() tokenizes a sender's messages, joined
+with newlines, as one corpus with a single findall() and a single Counter
+update, then drops stopwords and short words from the distinct words only.
+
+Words are ASCII letter runs by default. With unicode=True (or the
+WORD_TOKENS=unicode environment variable) they are runs of letters in any
+script, NFC-normalized and case-folded, so 'café' or 'привет' count as
+words instead of being split or dropped.
+"""
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# 'ascii' or 'unicode'; the default tokenizer for count_text_words() and tokenize()
+WORD_TOKENS = os.environ.get('WORD_TOKENS', 'ascii').strip().lower()
+# Words shorter than this are not counted
+MIN_WORD_LENGTH = 3
+
+ASCII_WORD_PATTERN = re.compile(r'\b[a-zA-Z]+\b')
+# Letters, plus combining accents left over after case folding (e.g. 'İ' folds to 'i' + U+0307)
+UNICODE_WORD_PATTERN = re.compile(r'[^\W\d_](?:[^\W\d_]|[\u0300-\u036f])*')
+
+# Stopwords for chat analysis: common English words, chat filler and Instagram's system message words
+CHAT_STOPWORDS = frozenset([
+    'the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'i', 'it', 'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at', 'this', 'but', 'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she', 'or', 'an', 'will', 'my', 'one', 'all', 'would', 'there', 'their', 'what', 'so', 'up', 'out', 'if', 'about', 'who', 'get', 'which', 'go', 'me', 'when', 'make', 'can', 'like', 'time', 'no', 'just', 'him', 'know', 'take', 'people', 'into', 'year', 'your', 'good', 'some', 'could', 'them', 'see', 'other', 'than', 'then', 'now', 'look', 'only', 'come', 'its', 'over', 'think', 'also', 'back', 'after', 'use', 'two', 'how', 'our', 'work', 'first', 'well', 'way', 'even', 'new', 'want', 'because', 'any', 'these', 'give', 'day', 'most', 'us',
+    'oh', 'yeah', 'yes', 'no', 'ok', 'okay', 'haha', 'lol', 'omg', 'wow', 'hey', 'hi', 'hello', 'bye', 'goodbye', 'thanks', 'thank',
+    'sent', 'used', 'am', 'as', 'were', 'was', 'is', 'are', 'did', 'had', 'has', 'u', 'im', 'dont', 'cant', 'wont', 'didnt', 'doesnt', 'should', 'shouldnt', 'couldnt', 'wouldnt', 'instagram', 'photo', 'video', 'reel', 'story', 'message', 'messages', 'chat', 'call', 'missed', 'unsent', 'attachment', 'replied', 'reply', 'link', 'shared', 'sticker', 'gif', 'voice', 'media', 'group'
+])
+
+
+def _use_unicode(unicode):
+    return WORD_TOKENS == 'unicode' if unicode is None else unicode
+
+
+def _normalize(text, unicode):
+    if unicode:
+        return unicodedata.normalize('NFC', text.casefold())
+    return text.lower()
+
+
+def tokenize(text, unicode=None):
+    """Lowercased words of a text, in order."""
+    unicode = _use_unicode(unicode)
+    pattern = UNICODE_WORD_PATTERN if unicode else ASCII_WORD_PATTERN
+    return pattern.findall(_normalize(text, unicode))
+
+
+def count_text_words(text, stopwords=CHAT_STOPWORDS, unicode=None):
+    """Counter of words in message texts joined with newlines, in first-seen order.
+
+    Stopwords and words shorter than MIN_WORD_LENGTH are left out.
+    """
+    counts = Counter(tokenize(text, unicode))
+    for word in [w for w in counts if w in stopwords or len(w) < MIN_WORD_LENGTH]:
+        del counts[word]
+    return counts
+
+
+def name_stopwords(name, stopwords=CHAT_STOPWORDS, unicode=None):
+    """Stopwords plus a participant's name and its parts."""
+    if not name:
+        return stopwords
+    folded = _normalize(name, _use_unicode(unicode))
+    return stopwords | {folded, name, *folded.split()}
@@ -0,0 +1,96 @@
+"""Session-scoped index over an uploaded export ZIP.
+
+The central directory is read once at upload into a plain dict:
+    'zip_path'      path of the archive on disk
+    'chat_folders'  chat folder -> message_N.json members in N order, each
+                    {'name', 'offset', 'compress_size', 'file_size', 'crc'}
+    'participants'  chat folder -> participant names, filled in at ingest
+
+Open ZipFile handles are pooled per archive so lookups never re-parse the
+central directory; ZipFile serializes reads on a shared handle internally.
+"""
+import re
+import threading
+import zipfile
+
+MESSAGE_FILE_PATTERN = re.compile(r'message_(\d+)\.json')
+
+_zip_handles = {}
+_zip_handles_lock = threading.Lock()
+
+
+def get_zip_handle(zip_path):
+    """Return the pooled ZipFile for an archive, opening it on first use."""
+    with _zip_handles_lock:
+        zip_ref = _zip_handles.get(zip_path)
+        if zip_ref is None:
+            zip_ref = _zip_handles[zip_path] = zipfile.ZipFile(zip_path, 'r')
+        return zip_ref
+
+
+def release_zip_handle(zip_path):
+    """Close and forget the pooled handle for an archive, if any."""
+    with _zip_handles_lock:
+        zip_ref = _zip_handles.pop(zip_path, None)
+    if zip_ref is not None:
+        zip_ref.close()
+
+
+def inbox_chat_folder(file_path):
+    """(chat_folder, N) for an inbox message_N.json path, or None for anything else."""
+    if 'inbox/' not in file_path:
+        return None
+    parts = file_path.split('/')
+    # Find the inbox folder and the chat folder after it
+    try:
+        inbox_index = parts.index('inbox')
+    except ValueError:
+        return None
+    if inbox_index + 2 >= len(parts):
+        return None
+    match = MESSAGE_FILE_PATTERN.fullmatch(parts[-1])
+    if not match:
+        return None
+    return parts[inbox_index + 1], int(match.group(1))
+
+
+def build_zip_index(zip_path):
+    """Read the archive's central directory once and index inbox message files by chat folder."""
+    zip_ref = get_zip_handle(zip_path)
+    chat_folders = {}
+    for info in zip_ref.infolist():
+        location = inbox_chat_folder(info.filename)
+        if location is None:
+            continue
+        folder, number = location
+        chat_folders.setdefault(folder, []).append((number, {
+            'name': info.filename,
+            'offset': info.header_offset,
+            'compress_size': info.compress_size,
+            'file_size': info.file_size,
+            'crc': info.CRC,
+        }))
+    return {
+        'zip_path': zip_path,
+        'chat_folders': {
+            folder: [member for _, member in sorted(members, key=lambda m: m[0])]
+            for folder, members in chat_folders.items()
+        },
+        'participants': {},
+    }
+
+
+def chat_members(zip_index, chat_folder):
+    """Indexed message_N.json members for a chat folder (empty if unknown)."""
+    return zip_index['chat_folders'].get(chat_folder, [])
+
+
+def member_file_name(member):
+    """File name of an indexed member without its folders, e.g. 'message_1.json'."""
+    return member['name'].rsplit('/', 1)[-1]
+
+
+def open_member(zip_index, member):
+    """Open an indexed member for reading on the pooled handle."""
+    zip_ref = get_zip_handle(zip_index['zip_path'])
+    return zip_ref.open(zip_ref.getinfo(member['name']))
@@ -6,8 +6,11 @@ import { motion } from 'framer-motion';
 import { Upload, File, X, CheckCircle, Clock, BarChart3, Folder, FileText } from 'lucide-react';
 import { useData } from '../contexts/DataContext';
 
+// ZIPs larger than this are uploaded in chunks instead of being unzipped in the browser
+const CHUNKED_UPLOAD_THRESHOLD = 512 * 1024 * 1024;
+
 const FileUpload = () => {
-  const { uploadFile, uploadProcessedData, isLoading, setUserName, userName } = useData();
+  const { uploadFile, uploadZipChunked, uploadProcessedData, isLoading, setUserName, userName } = useData();
   const navigate = useNavigate();
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [uploadProgress, setUploadProgress] = useState('');
@@ -155,7 +158,24 @@ const FileUpload = () => {
     if (file) {
       setUploadedFiles(acceptedFiles);
       
-      if (file.name.endsWith('.zip')) {
+      if (file.name.endsWith('.zip') && file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        // Too large to unzip in the browser; send it in resumable chunks
+        setCurrentStep('Uploading ZIP file...');
+        const success = await uploadZipChunked(file, (fraction) => {
+          setProgressPercentage(Math.round(fraction * 95));
+        });
+        if (success) {
+          setProgressPercentage(100);
+          setCurrentStep('Complete! Redirecting...');
+          setTimeout(() => {
+            setUploadedFiles([]);
+            setUploadProgress('');
+            setProgressPercentage(0);
+            setCurrentStep('');
+            navigate("/");
+          }, 1000);
+        }
+      } else if (file.name.endsWith('.zip')) {
         // Process ZIP client-side
         await processZipClientSide(file);
       } else if (file.name.endsWith('.json')) {
@@ -176,7 +196,7 @@ const FileUpload = () => {
         }
       }
     }
-  }, [uploadFile, navigate]);
+  }, [uploadFile, uploadZipChunked, navigate]);
 
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     onDrop,
@@ -1,6 +1,9 @@
 import React, { createContext, useContext, useState } from 'react';
 import { toast } from 'react-hot-toast';
 import axios from 'axios';
+import { compressUpload, encodeColumnarUpload } from '../utils/columnarUpload';
+import { uploadZipInChunks } from '../utils/chunkedUpload';
+import { expandNetworkRefs, streamNetworkAnalysis } from '../utils/networkStream';
 
 const DataContext = createContext();
 
@@ -35,11 +38,14 @@ export const DataProvider = ({ children }) => {
     setIsLoading(true);
     
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/upload-processed`, processedData, {
-        headers: {
-          'Content-Type': 'application/json',
-        },
-      });
+      // Columnar binary body instead of one giant JSON document
+      const encoded = encodeColumnarUpload(processedData.friends, processedData.user_name, processedData.incremental);
+      const { body, encoding } = await compressUpload(encoded);
+      const headers = { 'Content-Type': 'application/octet-stream' };
+      if (encoding) {
+        headers['Content-Encoding'] = encoding;
+      }
+      const response = await axios.post(`${API_BASE_URL}/api/upload-columnar`, body, { headers });
 
       if (response.data.success) {
         console.log('Upload successful, sessionId:', response.data.session_id);
@@ -92,7 +98,28 @@ export const DataProvider = ({ children }) => {
     }
   };
 
-  const getFriendAnalysis = async (friendId) => {
+  const uploadZipChunked = async (file, onProgress) => {
+    setIsLoading(true);
+    try {
+      const data = await uploadZipInChunks(API_BASE_URL, file, onProgress);
+      setSessionId(data.session_id);
+      setFriends(data.friends || []);
+      if (data.user_name) {
+        setUserName(data.user_name);
+      }
+      toast.success('File uploaded successfully!');
+      return true;
+    } catch (error) {
+      console.error('Chunked upload error:', error);
+      toast.error(error.response?.data?.error || error.message || 'Upload failed');
+      return false;
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  // fields: optional list of analysis sections (e.g. ['summary']); the server computes and caches each on its own
+  const getFriendAnalysis = async (friendId, fields) => {
     console.log('getFriendAnalysis called with friendId:', friendId, 'sessionId:', sessionId);
     if (!sessionId) {
       console.error('No sessionId available');
@@ -101,13 +128,14 @@ export const DataProvider = ({ children }) => {
 
     setIsLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/analysis/${friendId}?session_id=${sessionId}`);
+      const fieldsParam = fields ? `&fields=${fields.join(',')}` : '';
+      const response = await axios.get(`${API_BASE_URL}/api/analysis/${friendId}?session_id=${sessionId}${fieldsParam}`);
       console.log('Analysis response:', response.data);
       
       if (response.data.success) {
         setFriendAnalysis(prev => ({
           ...prev,
-          [friendId]: response.data.analysis
+          [friendId]: { ...prev[friendId], ...response.data.analysis }
         }));
         return response.data.analysis;
       } else {
@@ -129,11 +157,12 @@ export const DataProvider = ({ children }) => {
 
     setIsLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/network?session_id=${sessionId}`);
+      const response = await axios.get(`${API_BASE_URL}/api/network?session_id=${sessionId}&refs=1`);
       
       if (response.data.success) {
-        setNetworkAnalysis(response.data.network);
-        return response.data.network;
+        const network = expandNetworkRefs(response.data.network);
+        setNetworkAnalysis(network);
+        return network;
       } else {
         toast.error(response.data.error || 'Failed to get network analysis');
         return null;
@@ -147,6 +176,21 @@ export const DataProvider = ({ children }) => {
     }
   };
 
+  // Renders progressively: onUpdate gets the network built so far as friends are analyzed
+  const streamNetwork = async (onUpdate) => {
+    if (!sessionId) return null;
+
+    try {
+      const network = await streamNetworkAnalysis(API_BASE_URL, sessionId, onUpdate);
+      setNetworkAnalysis(network);
+      return network;
+    } catch (error) {
+      console.error('Network analysis error:', error);
+      toast.error(error.message || 'Failed to get network analysis');
+      return null;
+    }
+  };
+
   const getFriendDetails = async (friendId) => {
     if (!sessionId) return;
 
@@ -204,11 +248,13 @@ export const DataProvider = ({ children }) => {
     setUserName,
     sessionId,
     uploadFile,
+    uploadZipChunked,
     uploadProcessedData,
     getFriendAnalysis,
     getFriendDetails,
     getQuickStats,
     getNetworkAnalysis,
+    streamNetwork,
     clearData,
   };
 
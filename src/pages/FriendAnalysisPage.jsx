@@ -18,6 +18,18 @@ const CustomTooltip = ({ text }) => (
   </span>
 );
 
+// Analysis sections requested from /api/analysis (see ANALYSIS_SECTIONS in backend/friend_analysis.py)
+const SUMMARY_FIELDS = ['summary'];
+const DETAIL_FIELDS = ['words', 'emojis', 'lengths', 'timing', 'responses', 'shared', 'gaps'];
+
+// Response sections arrive after the summary; show a placeholder until then
+const formatResponseTime = (seconds) => {
+  if (seconds == null) return '…';
+  if (seconds < 60) return `${seconds.toFixed(1)}s`;
+  if (seconds < 3600) return `${(seconds / 60).toFixed(1)}m`;
+  return `${(seconds / 3600).toFixed(1)}h`;
+};
+
 const FriendAnalysisPage = () => {
   const { friendId } = useParams();
   const { getFriendAnalysis, isLoading } = useData();
@@ -36,10 +48,16 @@ const FriendAnalysisPage = () => {
   const fetchAnalysis = async () => {
     try {
       setLoading(true);
-      const analysisData = await getFriendAnalysis(friendId);
+      // Counts first for a quick first paint, then the word, timing and other sections
+      const summary = await getFriendAnalysis(friendId, SUMMARY_FIELDS);
       
-      if (analysisData) {
-        setAnalysis(analysisData);
+      if (summary) {
+        setAnalysis(summary);
+        setLoading(false);
+        const details = await getFriendAnalysis(friendId, DETAIL_FIELDS);
+        if (details) {
+          setAnalysis(prev => ({ ...prev, ...details }));
+        }
       } else {
         setError('Failed to fetch analysis data');
       }
@@ -90,6 +108,8 @@ const FriendAnalysisPage = () => {
   const friendName = analysis.friend?.name || 'Unknown';
   const yourWords = Array.isArray(analysis.your_words) ? analysis.your_words : [];
   const theirWords = Array.isArray(analysis.their_words) ? analysis.their_words : [];
+  const yourEmojis = Array.isArray(analysis.your_emojis) ? analysis.your_emojis : [];
+  const theirEmojis = Array.isArray(analysis.their_emojis) ? analysis.their_emojis : [];
   const yourTiming = analysis.your_timing || {};
   // Debug: log daily timing data
   console.log('yourTiming.daily', yourTiming.daily);
@@ -240,23 +260,13 @@ const FriendAnalysisPage = () => {
               <div className="flex justify-between items-center p-4 bg-blue-50 dark:bg-blue-900 rounded-lg">
                 <span className="font-medium text-gray-900 dark:text-gray-100">Your average response:</span>
                 <span className="text-blue-600 dark:text-blue-300 font-bold">
-                  {analysis.your_avg_response < 60 
-                    ? `${analysis.your_avg_response.toFixed(1)}s`
-                    : analysis.your_avg_response < 3600
-                    ? `${(analysis.your_avg_response / 60).toFixed(1)}m`
-                    : `${(analysis.your_avg_response / 3600).toFixed(1)}h`
-                  }
+                  {formatResponseTime(analysis.your_avg_response)}
                 </span>
               </div>
               <div className="flex justify-between items-center p-4 bg-green-50 dark:bg-green-900 rounded-lg">
                 <span className="font-medium text-gray-900 dark:text-gray-100">{friendName}'s average response:</span>
                 <span className="text-green-600 dark:text-green-300 font-bold">
-                  {analysis.their_avg_response < 60 
-                    ? `${analysis.their_avg_response.toFixed(1)}s`
-                    : analysis.their_avg_response < 3600
-                    ? `${(analysis.their_avg_response / 60).toFixed(1)}m`
-                    : `${(analysis.their_avg_response / 3600).toFixed(1)}h`
-                  }
+                  {formatResponseTime(analysis.their_avg_response)}
                 </span>
               </div>
             </div>
@@ -474,6 +484,41 @@ Higher scores mean a closer, more active friendship.`
               </div>
             </motion.div>
           )}
+
+          {/* Emoji Analysis */}
+          {(yourEmojis.length > 0 || theirEmojis.length > 0) && (
+            <motion.div
+              initial={{ opacity: 0, y: 20 }}
+              animate={{ opacity: 1, y: 0 }}
+              className="bg-white dark:bg-gray-800 rounded-lg shadow-lg p-6 mt-6"
+            >
+              <h2 className="text-xl font-bold text-gray-800 dark:text-gray-100 mb-4">Most Used Emojis</h2>
+              <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+                <div>
+                  <h3 className="text-lg font-semibold text-blue-600 dark:text-blue-300 mb-3">Your emojis ({analysis.your_emoji_count || 0} sent)</h3>
+                  <div className="space-y-2">
+                    {yourEmojis.map((item, index) => (
+                      <div key={index} className="flex justify-between items-center p-2 bg-blue-50 dark:bg-blue-900 rounded">
+                        <span className="text-xl">{item[0]}</span>
+                        <span className="text-blue-600 dark:text-blue-300">{item[1]} times</span>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+                <div>
+                  <h3 className="text-lg font-semibold text-green-600 dark:text-green-300 mb-3">{friendName}'s emojis ({analysis.their_emoji_count || 0} sent)</h3>
+                  <div className="space-y-2">
+                    {theirEmojis.map((item, index) => (
+                      <div key={index} className="flex justify-between items-center p-2 bg-green-50 dark:bg-green-900 rounded">
+                        <span className="text-xl">{item[0]}</span>
+                        <span className="text-green-600 dark:text-green-300">{item[1]} times</span>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+              </div>
+            </motion.div>
+          )}
         </div>
       </div>
     </div>
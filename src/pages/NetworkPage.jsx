@@ -10,7 +10,7 @@ import { Info } from 'lucide-react';
 import { useTheme } from '../contexts/ThemeContext';
 
 const NetworkPage = () => {
-  const { getNetworkAnalysis, isLoading } = useData();
+  const { streamNetwork, isLoading } = useData();
   const [networkData, setNetworkData] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -24,7 +24,11 @@ const NetworkPage = () => {
   const fetchNetworkData = async () => {
     try {
       setLoading(true);
-      const networkAnalysis = await getNetworkAnalysis();
+      // Show the rankings as soon as the first friends are analyzed and refresh them as the rest arrive
+      const networkAnalysis = await streamNetwork((partialNetwork) => {
+        setNetworkData(partialNetwork);
+        setLoading(false);
+      });
       
       if (networkAnalysis) {
         setNetworkData(networkAnalysis);
@@ -120,6 +124,11 @@ const NetworkPage = () => {
           <p className="text-gray-600 dark:text-gray-300">
             {networkData.total_friends} friends • {networkData.total_messages.toLocaleString()} total messages
           </p>
+          {!networkData.complete && (
+            <p className="text-sm text-blue-600 dark:text-blue-300 mt-1">
+              Analyzing friends… {networkData.total_friends} of {networkData.friends_total} done
+            </p>
+          )}
         </motion.div>
 
         <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
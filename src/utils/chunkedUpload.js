@@ -0,0 +1,100 @@
+// Chunked, resumable ZIP uploads via /api/uploads (see backend/chunked_upload.py).
+// The upload id is remembered per file in localStorage, so re-dropping the same file
+// after a dropped connection or a page reload only sends the ranges still missing.
+import axios from 'axios';
+
+const CHUNK_ATTEMPTS = 3;
+const JOB_POLL_INTERVAL_MS = 1000;
+
+const resumeKey = (file) => `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const sha256Hex = async (buffer) => {
+  const digest = await crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+// The server infers whose export it is from the chats
+const resumeOrStart = async (apiBaseUrl, file) => {
+  const savedId = localStorage.getItem(resumeKey(file));
+  if (savedId) {
+    const { data } = await axios.get(`${apiBaseUrl}/api/uploads/${savedId}`);
+    if (data.success && data.status === 'receiving') {
+      return data;
+    }
+  }
+  const { data } = await axios.post(`${apiBaseUrl}/api/uploads`, {
+    filename: file.name,
+    size: file.size,
+  });
+  if (!data.success) {
+    throw new Error(data.error || 'Could not start upload');
+  }
+  localStorage.setItem(resumeKey(file), data.upload_id);
+  return data;
+};
+
+const putChunk = async (apiBaseUrl, uploadId, offset, chunk) => {
+  const checksum = await sha256Hex(chunk);
+  let lastError = null;
+  for (let attempt = 0; attempt < CHUNK_ATTEMPTS; attempt++) {
+    try {
+      const { data } = await axios.put(`${apiBaseUrl}/api/uploads/${uploadId}/chunks?offset=${offset}`, chunk, {
+        headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+      });
+      if (data.success) {
+        return data;
+      }
+      lastError = new Error(data.error || 'Chunk upload failed');
+    } catch (error) {
+      lastError = error;
+    }
+  }
+  throw lastError;
+};
+
+// Poll a background job (see /api/jobs) until it finishes; resolves to its result
+const waitForJob = async (apiBaseUrl, jobId) => {
+  for (;;) {
+    const { data } = await axios.get(`${apiBaseUrl}/api/jobs/${jobId}`);
+    if (!data.success) {
+      throw new Error(data.error || 'Upload job not found');
+    }
+    if (data.job.status === 'complete') {
+      const { data: result } = await axios.get(`${apiBaseUrl}/api/jobs/${jobId}/result`);
+      if (!result.success) {
+        throw new Error(result.error || 'Upload failed');
+      }
+      return result.result;
+    }
+    if (data.job.status === 'failed' || data.job.status === 'cancelled') {
+      throw new Error(data.job.error || `Upload ${data.job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
+/**
+ * Upload a ZIP in chunks and finalize it; resolves to the ingest result
+ * ({ session_id, friends, user_name }). onProgress receives the fraction of bytes on the server.
+ * The server ingests the ZIP as a background job, so large exports don't hit request timeouts.
+ */
+export const uploadZipInChunks = async (apiBaseUrl, file, onProgress) => {
+  const upload = await resumeOrStart(apiBaseUrl, file);
+  let received = upload.received_bytes;
+  onProgress?.(received / file.size);
+  for (const [start, end] of upload.missing) {
+    for (let offset = start; offset < end; offset += upload.chunk_size) {
+      const chunk = await file.slice(offset, Math.min(offset + upload.chunk_size, end)).arrayBuffer();
+      await putChunk(apiBaseUrl, upload.upload_id, offset, chunk);
+      received += chunk.byteLength;
+      onProgress?.(received / file.size);
+    }
+  }
+  const { data } = await axios.post(`${apiBaseUrl}/api/uploads/${upload.upload_id}/complete`, { async: true });
+  localStorage.removeItem(resumeKey(file));
+  if (!data.success) {
+    throw new Error(data.error || 'Upload failed');
+  }
+  // A retried finalize of an upload ingested synchronously has no job to wait for
+  return data.job_id ? waitForJob(apiBaseUrl, data.job_id) : data;
+};
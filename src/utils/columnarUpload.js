@@ -0,0 +1,100 @@
+// Compact columnar encoding for POST /api/upload-columnar.
+// The frame layout is documented in backend/binary_upload.py; integers are little-endian,
+// which typed arrays are on every platform browsers run on.
+
+const MAGIC = new Uint8Array([0x49, 0x47, 0x43, 0x31]); // "IGC1"
+const CHUNK_MESSAGES = 10000;
+
+// Message attribute bits
+const ATTR_MEDIA = 1; // message has photos or videos
+const ATTR_SHARE = 2; // message has a share with a link
+
+const textEncoder = new TextEncoder();
+
+const frame = (type, payload) => {
+  const header = new DataView(new ArrayBuffer(5));
+  header.setUint8(0, type.charCodeAt(0));
+  header.setUint32(1, payload.byteLength, true);
+  return [new Uint8Array(header.buffer), payload];
+};
+
+const jsonFrame = (type, value) => frame(type, textEncoder.encode(JSON.stringify(value)));
+
+const concatBytes = (arrays) => {
+  const total = arrays.reduce((sum, array) => sum + array.byteLength, 0);
+  const bytes = new Uint8Array(total);
+  let offset = 0;
+  for (const array of arrays) {
+    bytes.set(new Uint8Array(array.buffer, array.byteOffset, array.byteLength), offset);
+    offset += array.byteLength;
+  }
+  return bytes;
+};
+
+const stringsFrame = (strings) => {
+  const encoded = strings.map((s) => textEncoder.encode(s));
+  const header = new DataView(new ArrayBuffer(4 + 4 * encoded.length));
+  header.setUint32(0, encoded.length, true);
+  encoded.forEach((bytes, i) => header.setUint32(4 + 4 * i, bytes.byteLength, true));
+  return frame('S', concatBytes([new Uint8Array(header.buffer), ...encoded]));
+};
+
+/**
+ * Encode friends (each with its raw `messages`) into a Blob of upload frames.
+ * Strings (senders, contents, share links) are sent once per upload and referenced by id.
+ */
+export const encodeColumnarUpload = (friends, userName, incremental = false) => {
+  const parts = [MAGIC, ...jsonFrame('H', { user_name: userName, incremental })];
+  const stringIds = new Map([['', 0]]);
+  let newStrings = [];
+  const intern = (value) => {
+    let id = stringIds.get(value);
+    if (id === undefined) {
+      id = stringIds.size;
+      stringIds.set(value, id);
+      newStrings.push(value);
+    }
+    return id;
+  };
+
+  for (const friend of friends) {
+    const { messages = [], ...metadata } = friend;
+    parts.push(...jsonFrame('F', metadata));
+    for (let start = 0; start < messages.length; start += CHUNK_MESSAGES) {
+      const chunk = messages.slice(start, start + CHUNK_MESSAGES);
+      const n = chunk.length;
+      const timestamps = new BigInt64Array(n);
+      const senders = new Uint32Array(n);
+      const contents = new Uint32Array(n);
+      const links = new Uint32Array(n);
+      const attrs = new Uint8Array(n);
+      chunk.forEach((msg, i) => {
+        timestamps[i] = BigInt(Math.trunc(msg.timestamp_ms || 0));
+        senders[i] = intern(msg.sender_name ?? '');
+        contents[i] = intern(msg.content || '');
+        if ('photos' in msg || 'videos' in msg) attrs[i] |= ATTR_MEDIA;
+        if (msg.share && 'link' in msg.share) {
+          attrs[i] |= ATTR_SHARE;
+          links[i] = intern(msg.share.link);
+        }
+      });
+      // Strings have to arrive before the messages that refer to them
+      if (newStrings.length) {
+        parts.push(...stringsFrame(newStrings));
+        newStrings = [];
+      }
+      parts.push(...frame('M', concatBytes([new Uint32Array([n]), timestamps, senders, contents, links, attrs])));
+    }
+  }
+  parts.push(...frame('E', new Uint8Array(0)));
+  return new Blob(parts);
+};
+
+/** Gzip a Blob when the browser supports CompressionStream; returns { body, encoding }. */
+export const compressUpload = async (blob) => {
+  if (typeof CompressionStream === 'undefined') {
+    return { body: blob, encoding: null };
+  }
+  const compressed = blob.stream().pipeThrough(new CompressionStream('gzip'));
+  return { body: await new Response(compressed).blob(), encoding: 'gzip' };
+};
@@ -0,0 +1,88 @@
+// Network analysis results by reference (/api/network?refs=1) and streamed (/api/network?stream=1).
+// See network_by_reference() and network_stream_records() in backend/app.py.
+
+const LEADERBOARDS = ['most_messages', 'most_balanced', 'longest_friendships', 'fastest_responses'];
+const CATEGORIES = ['best_friends', 'close_friends', 'regular_friends', 'occasional_friends', 'distant_friends'];
+
+// refs=1 sends each friend's analysis once, under `analyses`; rankings and categories list
+// friend ids. Put the analyses back in place of the ids.
+export const expandNetworkRefs = (network) => {
+  const { analyses, type, ...rest } = network;
+  const lookup = (ids) => ids.map((id) => analyses[id]);
+  const expanded = { ...rest };
+  LEADERBOARDS.forEach((name) => {
+    expanded[name] = lookup(network[name]);
+  });
+  expanded.categories = Object.fromEntries(
+    Object.entries(network.categories).map(([name, ids]) => [name, lookup(ids)])
+  );
+  return expanded;
+};
+
+/**
+ * Stream the network analysis as NDJSON. onUpdate receives the network built so far
+ * (friends' summaries in place of full analyses, plus friends_total and complete)
+ * after every analyzed friend; resolves to the final network.
+ */
+export const streamNetworkAnalysis = async (apiBaseUrl, sessionId, onUpdate) => {
+  const response = await fetch(`${apiBaseUrl}/api/network?session_id=${sessionId}&stream=1`);
+  if (!response.ok) {
+    throw new Error(`Network analysis failed (${response.status})`);
+  }
+  if (response.headers.get('Content-Type')?.includes('application/json')) {
+    // Checked before streaming starts, e.g. an unknown session
+    const data = await response.json();
+    throw new Error(data.error || 'Failed to get network analysis');
+  }
+
+  const summaries = {};
+  const categories = Object.fromEntries(CATEGORIES.map((name) => [name, []]));
+  let friendsTotal = 0;
+  let network = null;
+  const handleRecord = (record) => {
+    if (record.type === 'start') {
+      friendsTotal = record.friends_total;
+    } else if (record.type === 'friend') {
+      summaries[record.friend.friend.id] = record.friend;
+      categories[record.category] = [...categories[record.category], record.friend];
+    } else if (record.type === 'rankings') {
+      network = {
+        total_friends: record.total_friends,
+        total_messages: record.total_messages,
+        ...Object.fromEntries(
+          Object.entries(record.leaderboards).map(([name, ids]) => [name, ids.map((id) => summaries[id])])
+        ),
+        categories: { ...categories },
+        friends_total: friendsTotal,
+        complete: false,
+      };
+      onUpdate?.(network);
+    } else if (record.type === 'summary') {
+      network = { ...expandNetworkRefs({ ...record, analyses: summaries }), friends_total: friendsTotal, complete: true };
+      onUpdate?.(network);
+    } else if (record.type === 'error') {
+      throw new Error(record.error);
+    }
+  };
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => handleRecord(JSON.parse(line)));
+    if (done) {
+      break;
+    }
+  }
+  if (buffered.trim()) {
+    handleRecord(JSON.parse(buffered));
+  }
+  if (!network?.complete) {
+    throw new Error('Network analysis stream ended early');
+  }
+  return network;
+};